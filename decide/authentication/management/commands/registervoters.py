@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from authentication.register import register_voters
+
+
+class Command(BaseCommand):
+    help = 'Register the voters of a json file, where keys are usernames and values passwords'
+
+    def add_arguments(self, parser):
+        parser.add_argument('filename')
+        parser.add_argument('--voting', type=int, help='add the voters to the census of this voting')
+        parser.add_argument('--processes', type=int, help='number of processes to hash the passwords')
+
+    def handle(self, *args, **options):
+        with open(options['filename']) as f:
+            voters = json.loads(f.read())
+
+        try:
+            users, invalid = register_voters(voters, voting_id=options['voting'],
+                                             processes=options['processes'])
+        except IntegrityError:
+            raise CommandError("Some voters were registered at the same time, try again")
+
+        print("Created {} voters".format(len(users)))
+        if invalid:
+            print("Invalid usernames: {}".format(", ".join(invalid)))
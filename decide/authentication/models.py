@@ -1,7 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
+from rest_framework.authtoken.models import Token
+
+from base.cache import token_cache
 
 
 #Model for Profile
@@ -17,4 +20,22 @@ class Profile(models.Model):
 def update_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
-        instance.profile.save()
\ No newline at end of file
+        instance.profile.save()
+
+
+#Voter tokens revoked before their expiration, see tokens.VoterTokenGenerator
+class RevokedVoterToken(models.Model):
+    token = models.CharField(max_length=200, unique=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+
+#The cached users of the tokens are removed when the user or the token change
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    token_cache.delete_where(lambda user: user.get('id') == instance.id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
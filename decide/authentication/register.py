@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from base import mods
+from census.models import Census, CensusSnapshot
+from .models import Profile
+
+
+# processes -> pool, the pools are kept for all the requests of this process
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(processes=None):
+    with pools_lock:
+        if processes not in pools:
+            pools[processes] = ProcessPoolExecutor(max_workers=processes)
+        return pools[processes]
+
+
+def hash_passwords(passwords, processes=None):
+    '''
+    Hashes the passwords across a pool of processes, password hashing is
+    slow by design so it's the bottleneck registering many voters.
+    '''
+
+    if processes == 1 or len(passwords) < 2:
+        return [make_password(p) for p in passwords]
+
+    return list(get_pool(processes).map(make_password, passwords, chunksize=64))
+
+
+def valid_username(username):
+    try:
+        User._meta.get_field('username').run_validators(username)
+    except ValidationError:
+        return False
+    return True
+
+
+def register_voters(voters, voting_id=None, processes=None, token=''):
+    '''
+    Creates the users, profiles and auth tokens of all the voters with a
+    bulk insert for each model, and adds them to the census of voting_id.
+
+    voters is a dict of username -> password, returns a dict with the
+    created username -> user_pk and the list of invalid usernames as they
+    were given, empty, not valid for the User model, repeated or already
+    existing, or without a password.
+
+    Raises IntegrityError if any user is created at the same time by other
+    request, and then no user is created.
+    '''
+
+    invalid = [u for u, pwd in voters.items()
+               if not u or not pwd or not isinstance(pwd, str) or not valid_username(u)]
+
+    # the usernames are normalized when saved, so different usernames can
+    # be the same user, only the first one is created
+    normalized, given = {}, {}
+    for u, pwd in voters.items():
+        if u in invalid:
+            continue
+        n = User.normalize_username(u)
+        if n in normalized:
+            invalid.append(u)
+        else:
+            normalized[n] = pwd
+            given[n] = u
+
+    existing = list(User.objects.filter(username__in=list(normalized))
+                                .values_list('username', flat=True))
+    invalid += [given[u] for u in existing]
+    voters = {u: pwd for u, pwd in normalized.items() if u not in existing}
+
+    usernames = list(voters)
+    passwords = hash_passwords([voters[u] for u in usernames], processes)
+
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=u, password=pwd) for u, pwd in zip(usernames, passwords)
+        ])
+        Profile.objects.bulk_create([Profile(user=u) for u in users])
+        tokens = [Token(user=u) for u in users]
+        for t in tokens:
+            t.key = t.generate_key()
+        Token.objects.bulk_create(tokens)
+
+        voters_pk = [u.pk for u in users]
+        if voting_id and 'census' in settings.MODULES:
+            Census.objects.bulk_create([Census(voting_id=voting_id, voter_id=pk)
+                                        for pk in voters_pk])
+            # the bulk insert doesn't send signals
+            CensusSnapshot.invalidate(voting_id)
+
+    if voting_id and 'census' not in settings.MODULES:
+        mods.post('census', json={'voting_id': voting_id, 'voters': voters_pk},
+                  HTTP_AUTHORIZATION='Token ' + token)
+
+    return {u.username: u.pk for u in users}, invalid
@@ -11,6 +11,9 @@ from base import mods
 from urllib.parse import urlparse
 
 from .models import Profile
+from base.cache import token_cache
+from census.models import Census
+from voting.models import Question, Voting
 
 
 class AuthTestCase(APITestCase):
@@ -38,6 +41,10 @@ class AuthTestCase(APITestCase):
         token = response.json()
         self.assertTrue(token.get('token'))
 
+        data['voting'] = 'abc'
+        response = self.client.post('/authentication/login/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+
     def test_login_fail(self):
         data = {'username': 'voter1', 'password': '321'}
         response = self.client.post('/authentication/login/', data, format='json')
@@ -133,6 +140,99 @@ class AuthTestCase(APITestCase):
             sorted(list(response.json().keys())),
             ['token', 'user_pk']
         )
+
+    def test_register_bulk(self):
+        data = {'username': 'admin', 'password': 'admin'}
+        response = self.client.post('/authentication/login/', data, format='json')
+        token = response.json()
+
+        # the voters are only added to the census of an existing voting
+        token.update({'voters': {'user1': 'pwd1'}, 'voting': 1})
+        response = self.client.post('/authentication/register/bulk/', token, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(username='user1').exists())
+
+        question = Question(desc='q')
+        question.save()
+        voting = Voting.objects.create(name='v', question=question)
+        token.update({'voters': {'user1': 'pwd1', 'user2': 'pwd2', 'voter1': 'pwd3', 'user3': '',
+                                 'bad user': 'pwd4', 'u' * 151: 'pwd5', 'user6': 6},
+                      'voting': voting.id})
+        response = self.client.post('/authentication/register/bulk/', token, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(response.json()['invalid']),
+                         sorted(['bad user', 'u' * 151, 'user3', 'user6', 'voter1']))
+
+        users = response.json()['users']
+        self.assertEqual(sorted(users), ['user1', 'user2'])
+        self.assertEqual(sorted(Census.objects.values_list('voter_id', flat=True)),
+                         sorted(users.values()))
+        user = User.objects.get(username='user2')
+        self.assertTrue(user.check_password('pwd2'))
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+        self.assertTrue(Token.objects.filter(user=user).exists())
+
+        data = {'username': 'user1', 'password': 'pwd1'}
+        response = self.client.post('/authentication/login/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        # the same username once normalized
+        token.update({'voters': {'\ufb01le': 'pwd1', 'file': 'pwd2'}, 'voting': None})
+        response = self.client.post('/authentication/register/bulk/', token, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['users']), 1)
+        self.assertEqual(len(response.json()['invalid']), 1)
+
+        # the existing usernames are given back as they were sent
+        token.update({'voters': {'\ufb01le': 'pwd1'}})
+        response = self.client.post('/authentication/register/bulk/', token, format='json')
+        self.assertEqual(response.json()['invalid'], ['\ufb01le'])
+
+        with override_settings(REGISTER_MAX_BATCH=1):
+            token.update({'voters': {'user4': 'pwd4', 'user5': 'pwd5'}})
+            response = self.client.post('/authentication/register/bulk/', token, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_getuser_cache(self):
+        data = {'username': 'voter1', 'password': '123'}
+        response = self.client.post('/authentication/login/', data, format='json')
+        token = response.json()
+
+        token_cache.clear()
+        response = self.client.post('/authentication/getuser/', token, format='json')
+        self.assertEqual(response.json()['username'], 'voter1')
+        response = self.client.post('/authentication/getuser/', token, format='json')
+        self.assertEqual(token_cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+        # changing the user invalidates the cached token user
+        u = User.objects.get(username='voter1')
+        u.username = 'voter2'
+        u.save()
+        response = self.client.post('/authentication/getuser/', token, format='json')
+        self.assertEqual(response.json()['username'], 'voter2')
+
+        # the stats are only for the staff
+        response = self.client.get('/authentication/getuser/stats/', format='json',
+                                   HTTP_AUTHORIZATION='Token ' + token['token'])
+        self.assertEqual(response.status_code, 403)
+
+        User.objects.filter(username='admin').update(is_staff=True)
+        data = {'username': 'admin', 'password': 'admin'}
+        response = self.client.post('/authentication/login/', data, format='json')
+        admin = response.json()['token']
+        response = self.client.get('/authentication/getuser/stats/', format='json',
+                                   HTTP_AUTHORIZATION='Token ' + admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.json()), ['hits', 'misses', 'size'])
+
+        # the logout drops the cached token user
+        self.assertIsNotNone(token_cache.get(token['token']))
+        response = self.client.post('/authentication/logout/', token, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(token_cache.get(token['token']))
+        response = self.client.post('/authentication/getuser/', token, format='json')
+        self.assertEqual(response.status_code, 404)
+
 class LogOutGuiTests(TestCase):
 #Tests for the Logout Function
 
@@ -1,5 +1,12 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
-from django.utils import six
+from django.core import signing
+from django.utils import six, timezone
+
+from .models import RevokedVoterToken
  
 #Secure Token Generation by using the project SECRET KEY
  
@@ -10,4 +17,57 @@ class AccountActivationTokenGenerator(PasswordResetTokenGenerator):
             six.text_type(user.profile.email_confirmed)
         )
  
-account_activation_token = AccountActivationTokenGenerator()
\ No newline at end of file
+account_activation_token = AccountActivationTokenGenerator()
+
+
+#Stateless voter tokens, signed with VOTER_TOKEN_KEY, valid for one voter in one voting
+#for VOTER_TOKEN_MAX_AGE seconds. They can be checked without any database query, except
+#for the revoked tokens list that is loaded every TOKEN_CACHE_TTL seconds.
+class VoterTokenGenerator:
+    salt = 'authentication.tokens.VoterTokenGenerator'
+
+    def __init__(self):
+        self.revoked = set()
+        self.revoked_expires = 0
+
+    def make_token(self, voter_id, voting_id):
+        data = {'voter': voter_id, 'voting': voting_id}
+        return signing.dumps(data, key=settings.VOTER_TOKEN_KEY, salt=self.salt)
+
+    def load(self, token):
+        '''
+        Returns the data of the token if it's signed and not expired
+        '''
+
+        if not isinstance(token, str):
+            return None
+        try:
+            return signing.loads(token, key=settings.VOTER_TOKEN_KEY, salt=self.salt,
+                                 max_age=settings.VOTER_TOKEN_MAX_AGE)
+        except signing.BadSignature:
+            return None
+
+    def check_token(self, token, voting_id):
+        '''
+        Returns the voter id of the token if it's valid for the voting
+        '''
+
+        data = self.load(token)
+        if data is None or data.get('voting') != voting_id or token in self.get_revoked():
+            return None
+        return data.get('voter')
+
+    def get_revoked(self):
+        if self.revoked_expires < time.time():
+            self.revoked = set(RevokedVoterToken.objects.values_list('token', flat=True))
+            self.revoked_expires = time.time() + settings.TOKEN_CACHE_TTL
+        return self.revoked
+
+    def revoke(self, token):
+        #expired tokens are not valid anyway, so they're removed from the list
+        expired = timezone.now() - timedelta(seconds=settings.VOTER_TOKEN_MAX_AGE)
+        RevokedVoterToken.objects.filter(created__lt=expired).delete()
+        RevokedVoterToken.objects.get_or_create(token=token)
+        self.revoked.add(token)
+
+voter_token = VoterTokenGenerator()
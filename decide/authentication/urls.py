@@ -1,17 +1,18 @@
 from django.urls import include, path
-from rest_framework.authtoken.views import obtain_auth_token
 
 from django.urls import include, path
 from django.contrib.auth import views as auth_views
 
-from .views import GetUserView, LogoutView, RegisterView, RegisterGUI, LogOutTestView, AccountActivation, ProfileView, UserProfile, EditUserProfile, EditProfileView, DeleteProfile, DeleteProfileView
+from .views import LoginView, GetUserView, TokenCacheStatsView, LogoutView, RegisterView, RegisterBulkView, RegisterGUI, LogOutTestView, AccountActivation, ProfileView, UserProfile, EditUserProfile, EditProfileView, DeleteProfile, DeleteProfileView
 
 
 urlpatterns = [
-    path('login/', obtain_auth_token),
+    path('login/', LoginView.as_view()),
     path('logout/', LogoutView.as_view()),
     path('getuser/', GetUserView.as_view()),
+    path('getuser/stats/', TokenCacheStatsView.as_view()),
     path('register/', RegisterView.as_view()),
+    path('register/bulk/', RegisterBulkView.as_view()),
     path('profile/', ProfileView.as_view()),
     path('editprofile/', EditProfileView.as_view()),
     path('deleteprofile/', DeleteProfileView.as_view()),
@@ -6,12 +6,17 @@ from rest_framework.status import (
 )
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.views import ObtainAuthToken
 from django.contrib.auth.models import User
+from django.conf import settings
 from django.db import IntegrityError
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import ObjectDoesNotExist
 
 from .serializers import UserSerializer
+from base import mods
+from base.cache import token_cache
+from base.perms import UserIsStaff
 
 from django.shortcuts import render, redirect
 from django.utils.encoding import force_text, force_bytes
@@ -30,22 +35,65 @@ from django.contrib import messages
 
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
  
-from .tokens import account_activation_token
+from .tokens import account_activation_token, voter_token
+from .register import register_voters
  
 from .models import Profile
 from .forms import UpdateProfile
 
 
+class LoginView(ObtainAuthToken):
+    def post(self, request, *args, **kwargs):
+        """
+         * username: str
+         * password: str
+         * voting: id / nullable, to get a voter_token for this voting
+        """
+
+        serializer = self.serializer_class(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token, _ = Token.objects.get_or_create(user=user)
+
+        data = {'token': token.key}
+        voting = request.data.get('voting')
+        if voting:
+            try:
+                data['voter_token'] = voter_token.make_token(user.pk, int(voting))
+            except (TypeError, ValueError):
+                return Response({}, status=HTTP_400_BAD_REQUEST)
+        return Response(data)
+
+
 class GetUserView(APIView):
     def post(self, request):
         key = request.data.get('token', '')
-        tk = get_object_or_404(Token, key=key)
-        return Response(UserSerializer(tk.user, many=False).data)
+        user = token_cache.get(key)
+        if user is None:
+            tk = get_object_or_404(Token, key=key)
+            user = UserSerializer(tk.user, many=False).data
+            token_cache.set(key, user)
+        return Response(user)
+
+
+class TokenCacheStatsView(APIView):
+    permission_classes = (UserIsStaff,)
+
+    def get(self, request):
+        return Response(token_cache.stats())
 
 
 class LogoutView(APIView):
     def post(self, request):
         key = request.data.get('token', '')
+        # only the valid voter tokens are revoked, the rest aren't accepted anyway
+        vt = request.data.get('voter_token')
+        if vt and voter_token.load(vt) is None:
+            return Response({}, status=HTTP_400_BAD_REQUEST)
+
+        token_cache.delete(key)
+        if vt:
+            voter_token.revoke(vt)
         try:
             tk = Token.objects.get(key=key)
             tk.delete()
@@ -77,6 +125,41 @@ class RegisterView(APIView):
         return Response({'user_pk': user.pk, 'token': token.key}, HTTP_201_CREATED)
 
 
+class RegisterBulkView(APIView):
+    def post(self, request):
+        """
+         * token: str, superuser token
+         * voters: { username: password }, up to settings.REGISTER_MAX_BATCH
+         * voting: id / nullable, to add the voters to the census
+        """
+
+        key = request.data.get('token', '')
+        tk = get_object_or_404(Token, key=key)
+        if not tk.user.is_superuser:
+            return Response({}, status=HTTP_401_UNAUTHORIZED)
+
+        voters = request.data.get('voters')
+        if not voters or not isinstance(voters, dict) or \
+           len(voters) > settings.REGISTER_MAX_BATCH:
+            return Response({}, status=HTTP_400_BAD_REQUEST)
+
+        # the voters are only added to the census of an existing voting
+        voting = request.data.get('voting')
+        if voting is not None:
+            try:
+                voting = int(voting)
+            except (TypeError, ValueError):
+                return Response({}, status=HTTP_400_BAD_REQUEST)
+            if not mods.get('voting', params={'id': voting}):
+                return Response('Voting not found', status=HTTP_400_BAD_REQUEST)
+
+        try:
+            users, invalid = register_voters(voters, voting_id=voting, token=key)
+        except IntegrityError:
+            return Response({}, status=HTTP_400_BAD_REQUEST)
+        return Response({'users': users, 'invalid': invalid}, HTTP_201_CREATED)
+
+
 #Sign Up View
 #The Following class is partly under a MIT License, basically means that we have consulted the original
 #source at the time of writing this function. Corresponding link is on documentation.
@@ -0,0 +1,82 @@
+import time
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class LRUCache:
+    '''
+    In memory cache with a max number of entries, where the least recently
+    used entry is evicted first, and a ttl in seconds for each entry.
+
+    >>> c = LRUCache(maxsize=2, ttl=60)
+    >>> c.set('a', 1); c.set('b', 2); c.get('a')
+    1
+    >>> c.set('c', 3); c.get('b') is None
+    True
+    >>> c.delete_where(lambda v: v == 1); c.get('a') is None
+    True
+    >>> c.stats()
+    {'hits': 1, 'misses': 2, 'size': 1}
+    '''
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            expires, value = self.entries.get(key, (0, None))
+            if expires < time.time():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_where(self, condition):
+        with self.lock:
+            for key, (_, value) in list(self.entries.items()):
+                if condition(value):
+                    del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+
+# token -> serialized user, shared by every module served by this instance
+token_cache = LRUCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+# (voting id, api version) -> (serialized votings, etag), see voting.views
+voting_cache = LRUCache(settings.VOTING_CACHE_SIZE, settings.VOTING_CACHE_TTL)
+
+# ('id', voting id) or ('link', voting link) -> (voting id, booth context),
+# see booth.payload
+booth_cache = LRUCache(settings.VOTING_CACHE_SIZE, settings.BOOTH_CACHE_TTL)
+
+# (url, authorization) -> (etag, response text) of the GETs done with mods,
+# the entries are revalidated with If-None-Match so they never get stale
+response_cache = LRUCache(settings.RESPONSE_CACHE_SIZE, ttl=24 * 60 * 60)
@@ -0,0 +1,19 @@
+# Generated by Django 2.0 on 2026-10-19 18:10
+
+import base.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0003_auto_20180921_1119'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='key',
+            name='q',
+            field=base.models.BigBigField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-19 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_key_q'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='key',
+            name='curve',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+    ]
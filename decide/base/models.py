@@ -34,6 +34,11 @@ class Key(models.Model):
     g = BigBigField()
     y = BigBigField()
     x = BigBigField(blank=True, null=True)
+    # order of g, the keys without q use a safe prime, p = 2q + 1
+    q = BigBigField(blank=True, null=True)
+    # elliptic curve of the key, see mixnet.ec, empty for the finite field
+    # keys. The points of the curve keys are encoded as ints
+    curve = models.CharField(max_length=20, blank=True, default='')
 
     def __str__(self):
         if self.x:
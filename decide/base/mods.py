@@ -1,7 +1,10 @@
+import json
 import urllib
 import requests
 from django.conf import settings
 
+from base.cache import response_cache, token_cache
+
 
 def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
     '''
@@ -46,7 +49,19 @@ def query(modname, entry_point='/', method='get', baseurl=None, **kwargs):
     if params:
         url += '?{}'.format(urllib.parse.urlencode(params))
 
-    if method == 'get':
+    if method == 'get' and not kwargs.get('response', False):
+        # conditional GET, if the response has an ETag it's cached and the
+        # next request only receives a 304 while it doesn't change
+        key = (url, headers.get('Authorization'))
+        cached = response_cache.get(key)
+        if cached:
+            headers['If-None-Match'] = cached[0]
+        response = q(url, headers=headers)
+        if response.status_code == 304 and cached:
+            return json.loads(cached[1])
+        if response.status_code == 200 and response.headers.get('ETag'):
+            response_cache.set(key, (response.headers['ETag'], response.text))
+    elif method == 'get':
         response = q(url, headers=headers)
     else:
         json_data = kwargs.get('json', {})
@@ -66,6 +81,24 @@ def post(*args, **kwargs):
     return query(*args, method='post', **kwargs)
 
 
+def get_user(token):
+    '''
+    Returns the user of the token from the authentication module, or None if
+    the token isn't valid. The users are cached by token, see
+    settings.TOKEN_CACHE_SIZE and settings.TOKEN_CACHE_TTL.
+    '''
+
+    user = token_cache.get(token)
+    if user is None:
+        response = post('authentication', entry_point='/getuser/',
+                        json={'token': token}, response=True)
+        if response.status_code != 200:
+            return None
+        user = response.json()
+        token_cache.set(token, user)
+    return user
+
+
 def mock_query(client):
     '''
     Function to build a mock to override the query function in this module.
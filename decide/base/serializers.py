@@ -17,3 +17,13 @@ class KeySerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Key
         fields = ('p', 'g', 'y')
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # only the elliptic curve keys have a curve, and the Schnorr group
+        # keys a q
+        if instance.curve:
+            data['curve'] = instance.curve
+        if instance.q:
+            data['q'] = int(instance.q)
+        return data
@@ -0,0 +1,56 @@
+import json
+
+from django.conf import settings
+
+from base import mods
+from base.cache import booth_cache
+
+
+def cache_payload(voting):
+    '''
+    Builds the context of the booth page from the serialized voting and
+    caches it by the voting id and link. Returns None if the voting has no
+    public key yet.
+    '''
+
+    if not voting.get('pub_key'):
+        return None
+
+    # Casting numbers to string to manage in javascript with BigInt
+    # and avoid problems with js and big number conversion
+    voting = dict(voting, pub_key={k: str(v) for k, v in voting['pub_key'].items()})
+    payload = (voting['id'], {
+        'voting': json.dumps(voting),
+        'KEYBITS': settings.KEYBITS,
+        # the booth only encrypts to finite field keys
+        'CURVE': voting['pub_key'].get('curve', ''),
+    })
+
+    booth_cache.set(('id', voting['id']), payload)
+    if voting.get('link'):
+        booth_cache.set(('link', voting['link']), payload)
+    return payload[1]
+
+
+def get_payload(voting_id=None, link=None):
+    '''
+    Returns the context of the booth page of a voting, by id or by link.
+    It's usually built when the voting starts, see Voting.create_booth_payload,
+    so this is a single cache read.
+    '''
+
+    key = ('id', voting_id) if link is None else ('link', link)
+    payload = booth_cache.get(key)
+    if payload is not None:
+        return payload[1]
+
+    if link is not None:
+        from voting.models import Voting
+        voting_id = Voting.objects.filter(link=link).values_list('id', flat=True).first()
+        if voting_id is None:
+            return None
+
+    r = mods.get('voting', params={'id': voting_id})
+    if not r:
+        return None
+    return cache_payload(r[0])
@@ -1,3 +1,69 @@
-from django.test import TestCase
+from django.conf import settings
+from django.test.utils import override_settings
 
-# Create your tests here.
+from base.cache import booth_cache
+from base.models import Auth, Key
+from base.tests import BaseTestCase
+from voting.models import Voting, Question, QuestionOption
+
+
+# the booth page is rendered without the collected static files manifest
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class BoothTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        q = Question(desc='test question')
+        q.save()
+        for i in range(3):
+            QuestionOption(question=q, option='option {}'.format(i + 1)).save()
+        self.voting = Voting(name='test voting', question=q, link='testlink',
+                             pub_key=Key.objects.create(p=23, g=5, y=8))
+        self.voting.save()
+        a, _ = Auth.objects.get_or_create(url=settings.BASEURL,
+                                          defaults={'me': True, 'name': 'test auth'})
+        self.voting.auths.add(a)
+
+    def tearDown(self):
+        super().tearDown()
+        booth_cache.clear()
+
+    def test_booth_payload(self):
+        self.voting.create_booth_payload()
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/booth/{}/'.format(self.voting.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('"y": "8"', response.context['voting'])
+        self.assertEqual(response.context['KEYBITS'], settings.KEYBITS)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/booth/url/testlink/')
+        self.assertEqual(response.status_code, 200)
+
+        self.voting.name = 'changed'
+        self.voting.save()
+        response = self.client.get('/booth/url/testlink/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('changed', response.context['voting'])
+
+    def test_booth_not_found(self):
+        response = self.client.get('/booth/url/wronglink/')
+        self.assertEqual(response.status_code, 404)
+
+        self.voting.pub_key = None
+        self.voting.save()
+        response = self.client.get('/booth/{}/'.format(self.voting.id))
+        self.assertEqual(response.status_code, 404)
+
+    def test_booth_curve_key(self):
+        response = self.client.get('/booth/{}/'.format(self.voting.id))
+        self.assertContains(response, 'v-on:click="decideSend"')
+
+        # the booth can't encrypt to the elliptic curve keys
+        self.voting.pub_key = Key.objects.create(p=23, g=5, y=8, curve='P-256')
+        self.voting.save()
+        response = self.client.get('/booth/{}/'.format(self.voting.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['CURVE'], 'P-256')
+        self.assertNotContains(response, 'v-on:click="decideSend"')
@@ -1,10 +1,7 @@
-import json
 from django.views.generic import TemplateView
-from django.conf import settings
 from django.http import Http404
 
-from base import mods
-from voting import models
+from .payload import get_payload
 
 
 # TODO: check permissions and census
@@ -16,19 +13,13 @@ class BoothView(TemplateView):
         vid = kwargs.get('voting_id', 0)
 
         try:
-            r = mods.get('voting', params={'id': vid})
-
-            # Casting numbers to string to manage in javascript with BigInt
-            # and avoid problems with js and big number conversion
-            for k, v in r[0]['pub_key'].items():
-                r[0]['pub_key'][k] = str(v)
-
-            context['voting'] = json.dumps(r[0])
+            payload = get_payload(voting_id=vid)
         except:
             raise Http404
+        if payload is None:
+            raise Http404
 
-        context['KEYBITS'] = settings.KEYBITS
-
+        context.update(payload)
         return context
 class BoothViewUrl(TemplateView):
     template_name = 'booth/booth.html'
@@ -38,18 +29,11 @@ class BoothViewUrl(TemplateView):
         vid = kwargs.get('voting_link', 0)
 
         try:
-            vot = models.Voting.objects.get(link=vid)
-            r = mods.get('voting', params={'id': vot.id})
-
-            # Casting numbers to string to manage in javascript with BigInt
-            # and avoid problems with js and big number conversion
-            for k, v in r[0]['pub_key'].items():
-                r[0]['pub_key'][k] = str(v)
-
-            context['voting'] = json.dumps(r[0])
+            payload = get_payload(link=vid)
         except:
             raise Http404
+        if payload is None:
+            raise Http404
 
-        context['KEYBITS'] = settings.KEYBITS
-
-        return context
\ No newline at end of file
+        context.update(payload)
+        return context
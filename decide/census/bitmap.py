@@ -0,0 +1,89 @@
+'''
+>>> b = CensusBitmap([1, 5, 9])
+>>> 5 in b, 6 in b, 1000 in b
+(True, False, False)
+>>> len(b), list(b)
+(3, [1, 5, 9])
+>>> list(b | CensusBitmap([2, 5]))
+[1, 2, 5, 9]
+>>> list(b - CensusBitmap([5, 20]))
+[1, 9]
+>>> list(b & CensusBitmap([5, 9, 20]))
+[5, 9]
+>>> b.count([1, 2, 9, 9])
+2
+>>> CensusBitmap.from_bytes(b.to_bytes()) == b
+True
+'''
+
+import zlib
+
+
+class CensusBitmap:
+    '''
+    Set of voter ids stored as a bitmap, bit n is set if the voter n is in
+    the census. The bitmap is zlib compressed to be stored in the database,
+    big runs of zeros or ones compress really well.
+
+    Membership is O(1) and set operations are done over the whole bitmap as
+    python integers.
+    '''
+
+    def __init__(self, voter_ids=()):
+        voter_ids = list(voter_ids)
+        size = max(voter_ids) // 8 + 1 if voter_ids else 0
+        self.bits = bytearray(size)
+        for v in voter_ids:
+            self.bits[v >> 3] |= 1 << (v & 7)
+
+    @classmethod
+    def from_bytes(cls, data):
+        b = cls()
+        b.bits = bytearray(zlib.decompress(data))
+        return b
+
+    @classmethod
+    def from_int(cls, n):
+        b = cls()
+        b.bits = bytearray(n.to_bytes((n.bit_length() + 7) // 8, 'little'))
+        return b
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self.bits))
+
+    def to_int(self):
+        return int.from_bytes(self.bits, 'little')
+
+    def __contains__(self, voter_id):
+        i = voter_id >> 3
+        return 0 <= i < len(self.bits) and bool(self.bits[i] & (1 << (voter_id & 7)))
+
+    def __iter__(self):
+        for i, byte in enumerate(self.bits):
+            while byte:
+                low = byte & -byte
+                yield (i << 3) + low.bit_length() - 1
+                byte ^= low
+
+    def __len__(self):
+        return bin(self.to_int()).count('1')
+
+    def __eq__(self, other):
+        return self.to_int() == other.to_int()
+
+    def __or__(self, other):
+        return CensusBitmap.from_int(self.to_int() | other.to_int())
+
+    def __and__(self, other):
+        return CensusBitmap.from_int(self.to_int() & other.to_int())
+
+    def __sub__(self, other):
+        return CensusBitmap.from_int(self.to_int() & ~other.to_int())
+
+    def count(self, voter_ids):
+        '''
+        Number of different voter_ids in this census, useful to calculate
+        the turnout from the votes voter ids.
+        '''
+
+        return len(self & CensusBitmap(voter_ids))
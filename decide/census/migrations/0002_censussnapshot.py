@@ -0,0 +1,23 @@
+# Generated by Django 2.0 on 2026-10-19 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('census', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CensusSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('voting_id', models.PositiveIntegerField(unique=True)),
+                ('bitmap', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-19 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('census', '0002_censussnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='censussnapshot',
+            name='stale',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,9 +1,207 @@
-from django.db import models
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .bitmap import CensusBitmap
+
+
+# SQL to select the voter ids resulting of each census operation over the
+# source votings
+CENSUS_OPERATIONS = {
+    'clone': '''
+        SELECT DISTINCT voter_id FROM {table} WHERE voting_id = ANY(%(sources)s)
+    ''',
+    'union': '''
+        SELECT DISTINCT voter_id FROM {table} WHERE voting_id = ANY(%(sources)s)
+    ''',
+    'intersect': '''
+        SELECT voter_id FROM {table} WHERE voting_id = ANY(%(sources)s)
+        GROUP BY voter_id HAVING COUNT(*) = %(nsources)s
+    ''',
+    'subtract': '''
+        SELECT c.voter_id FROM {table} c WHERE c.voting_id = %(first)s
+        AND NOT EXISTS (SELECT 1 FROM {table} o
+                        WHERE o.voter_id = c.voter_id AND o.voting_id = ANY(%(rest)s))
+    ''',
+}
+
+
+class CensusQuerySet(models.QuerySet):
+
+    def voters_in(self, voting_id, voter_ids):
+        '''
+        Returns the subset of voter_ids that are in the census of voting_id,
+        using a single query against the (voting_id, voter_id) index.
+        '''
+
+        snapshot = CensusSnapshot.get(voting_id)
+        if snapshot is not None:
+            return {int(v) for v in voter_ids if int(v) in snapshot}
+
+        return set(self.filter(voting_id=voting_id, voter_id__in=voter_ids)
+                       .values_list('voter_id', flat=True))
+
+    def is_voter(self, voting_id, voter_id):
+        snapshot = CensusSnapshot.get(voting_id)
+        if snapshot is not None:
+            return int(voter_id) in snapshot
+
+        return self.filter(voting_id=voting_id, voter_id=voter_id).exists()
+
+    def operation(self, op, voting_id, sources):
+        '''
+        Adds to the census of voting_id the result of the operation over the
+        census of the sources votings. The whole operation is done in the
+        database with an INSERT ... SELECT, clone replaces the census of
+        voting_id.
+
+        * clone, union: voters in any of the sources
+        * intersect: voters in all the sources
+        * subtract: voters in the first source but not in the rest
+
+        Returns the number of voters added.
+        '''
+
+        select = CENSUS_OPERATIONS[op].format(table=Census._meta.db_table)
+        params = {
+            'voting_id': voting_id,
+            'sources': list(sources),
+            'nsources': len(set(sources)),
+            'first': sources[0],
+            'rest': list(sources[1:]),
+        }
+        sql = '''
+            INSERT INTO {table} (voting_id, voter_id)
+            SELECT %(voting_id)s, voter_id FROM ({select}) AS voters
+            ON CONFLICT DO NOTHING
+        '''.format(table=Census._meta.db_table, select=select)
+
+        with transaction.atomic():
+            if op == 'clone':
+                self.filter(voting_id=voting_id).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                added = cursor.rowcount
+        # the insert doesn't send signals
+        CensusSnapshot.invalidate(voting_id)
+        return added
 
 
 class Census(models.Model):
     voting_id = models.PositiveIntegerField()
     voter_id = models.PositiveIntegerField()
 
+    objects = CensusQuerySet.as_manager()
+
     class Meta:
         unique_together = (('voting_id', 'voter_id'),)
+
+
+class CensusSnapshot(models.Model):
+    '''
+    Bitmap of the census of a voting, built when the voting starts. The
+    loaded bitmaps are kept in memory, and every CENSUS_SNAPSHOT_TTL seconds
+    they are checked against the created time of the snapshot in the
+    database, so every process sees the census changes with a single indexed
+    query, and the census changes of this process at once.
+
+    Any census change marks the snapshot as stale, and the plain census
+    queries are used until it's rebuilt, in a thread of this process with
+    CENSUS_SNAPSHOT_IN_BACKGROUND, or else with the snapshot api.
+    '''
+
+    voting_id = models.PositiveIntegerField(unique=True)
+    bitmap = models.BinaryField()
+    size = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now=True)
+    stale = models.BooleanField(default=False)
+
+    # voting_id -> (created time of the snapshot, CensusBitmap or None if
+    # there's no snapshot to use, time until it's checked again)
+    loaded = {}
+    # voting ids of the snapshots being rebuilt in background
+    building = set()
+    lock = threading.Lock()
+
+    @classmethod
+    def build(cls, voting_id):
+        voters = Census.objects.filter(voting_id=voting_id).values_list('voter_id', flat=True)
+        bitmap = CensusBitmap(voters.iterator())
+        snapshot, _ = cls.objects.update_or_create(voting_id=voting_id, defaults={
+            'bitmap': bitmap.to_bytes(),
+            'size': len(bitmap),
+            'stale': False,
+        })
+        cls.loaded[voting_id] = (snapshot.created, bitmap,
+                                 time.time() + settings.CENSUS_SNAPSHOT_TTL)
+        return bitmap
+
+    @classmethod
+    def build_in_background(cls, voting_id):
+        with cls.lock:
+            if voting_id in cls.building:
+                return
+            cls.building.add(voting_id)
+
+        def build():
+            try:
+                cls.build(voting_id)
+            finally:
+                connection.close()
+                with cls.lock:
+                    cls.building.discard(voting_id)
+
+        threading.Thread(target=build, daemon=True).start()
+
+    @classmethod
+    def invalidate(cls, voting_id):
+        '''
+        Marks the snapshot as stale after a census change, only if there's one
+        '''
+
+        voting_id = int(voting_id)
+        cls.loaded.pop(voting_id, None)
+        cls.objects.filter(voting_id=voting_id, stale=False).update(stale=True)
+
+    @classmethod
+    def get(cls, voting_id, wait=False):
+        '''
+        Returns the bitmap of the census, or None if there's no snapshot or
+        it's stale. With wait, a stale snapshot is rebuilt before returning.
+        '''
+
+        voting_id = int(voting_id)
+        now = time.time()
+        loaded, bitmap, expires = cls.loaded.get(voting_id, (None, None, 0))
+        if expires > now and (bitmap is not None or not wait):
+            return bitmap
+
+        expires = now + settings.CENSUS_SNAPSHOT_TTL
+        snapshot = cls.objects.filter(voting_id=voting_id).values_list('created', 'stale').first()
+        if snapshot is None:
+            cls.loaded[voting_id] = (None, None, expires)
+            return None
+
+        created, stale = snapshot
+        if stale:
+            if wait:
+                return cls.build(voting_id)
+            if settings.CENSUS_SNAPSHOT_IN_BACKGROUND:
+                cls.build_in_background(voting_id)
+            cls.loaded[voting_id] = (None, None, expires)
+            return None
+        if loaded != created or bitmap is None:
+            data = cls.objects.filter(voting_id=voting_id).values_list('bitmap', flat=True).first()
+            bitmap = CensusBitmap.from_bytes(bytes(data))
+        cls.loaded[voting_id] = (created, bitmap, expires)
+        return bitmap
+
+
+@receiver(post_save, sender=Census)
+@receiver(post_delete, sender=Census)
+def invalidate_census_snapshot(sender, instance, **kwargs):
+    CensusSnapshot.invalidate(instance.voting_id)
@@ -1,11 +1,13 @@
 import random
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.test import TestCase
 from rest_framework.test import APIClient
 
-from .models import Census
+from .models import Census, CensusSnapshot
 from base import mods
 from base.tests import BaseTestCase
+from store.models import Vote
 
 
 class CensusTestCase(BaseTestCase):
@@ -18,6 +20,7 @@ class CensusTestCase(BaseTestCase):
     def tearDown(self):
         super().tearDown()
         self.census = None
+        CensusSnapshot.loaded.clear()
 
     def test_check_vote_permissions(self):
         response = self.client.get('/census/{}/?voter_id={}'.format(1, 2), format='json')
@@ -28,6 +31,10 @@ class CensusTestCase(BaseTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json(), 'Valid voter')
 
+        for url in ('/census/1/', '/census/1/?voter_id=abc'):
+            response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, 400)
+
     def test_list_voting(self):
         response = self.client.get('/census/?voting_id={}'.format(1), format='json')
         self.assertEqual(response.status_code, 401)
@@ -73,3 +80,153 @@ class CensusTestCase(BaseTestCase):
         response = self.client.delete('/census/{}/'.format(1), data, format='json')
         self.assertEqual(response.status_code, 204)
         self.assertEqual(0, Census.objects.count())
+
+    def test_check_voters(self):
+        Census(voting_id=1, voter_id=3).save()
+        Census(voting_id=2, voter_id=2).save()
+        data = {'voters': [1, 2, 3, 4]}
+        response = self.client.post('/census/{}/check/'.format(1), data, format='json')
+        self.assertEqual(response.status_code, 401)
+
+        self.login(user='noadmin')
+        response = self.client.post('/census/{}/check/'.format(1), data, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        self.login()
+        response = self.client.post('/census/{}/check/'.format(1), data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'voters': [1, 3]})
+
+    def test_check_voters_invalid(self):
+        self.login()
+        data = {'voters': 'invalid'}
+        response = self.client.post('/census/{}/check/'.format(1), data, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        data = {'voters': list(range(settings.CENSUS_MAX_BATCH + 1))}
+        response = self.client.post('/census/{}/check/'.format(1), data, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_voters_in(self):
+        Census(voting_id=1, voter_id=3).save()
+        self.assertEqual(Census.objects.voters_in(1, [1, 2, 3]), {1, 3})
+        self.assertTrue(Census.objects.is_voter(1, 3))
+        self.assertFalse(Census.objects.is_voter(2, 3))
+
+    def test_snapshot(self):
+        Census(voting_id=1, voter_id=3).save()
+        response = self.client.post('/census/{}/snapshot/'.format(1), format='json')
+        self.assertEqual(response.status_code, 401)
+
+        self.login()
+        response = self.client.get('/census/{}/snapshot/'.format(1), format='json')
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.post('/census/{}/snapshot/'.format(1), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'size': 2})
+
+        Vote(voting_id=1, voter_id=3, a=1, b=1).save()
+        Vote(voting_id=1, voter_id=7, a=1, b=1).save()
+        response = self.client.get('/census/{}/snapshot/'.format(1), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'size': 2, 'turnout': 1})
+
+        # the loaded snapshot is used without queries
+        with self.assertNumQueries(0):
+            self.assertFalse(Census.objects.is_voter(1, 7))
+
+        # the census is queried while the snapshot is stale after a change
+        data = {'voting_id': 1, 'voters': [7]}
+        response = self.client.post('/census/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Census.objects.is_voter(1, 7))
+        self.assertTrue(CensusSnapshot.objects.get(voting_id=1).stale)
+
+        # and on the changes done out of the census api, like the admin
+        Census(voting_id=1, voter_id=8).save()
+        self.assertTrue(Census.objects.is_voter(1, 8))
+        Census.objects.filter(voting_id=1, voter_id=3).delete()
+        self.assertFalse(Census.objects.is_voter(1, 3))
+        self.assertEqual(CensusSnapshot.objects.get(voting_id=1).size, 2)
+
+        # until it's rebuilt
+        response = self.client.get('/census/{}/snapshot/'.format(1), format='json')
+        self.assertEqual(response.json(), {'size': 3, 'turnout': 1})
+        self.assertFalse(CensusSnapshot.objects.get(voting_id=1).stale)
+        self.assertTrue(Census.objects.is_voter(1, 8))
+
+        # the changes invalidated by other processes, with their own loaded
+        # snapshots, are seen after CENSUS_SNAPSHOT_TTL
+        Census.objects.bulk_create([Census(voting_id=1, voter_id=9)])
+        CensusSnapshot.objects.filter(voting_id=1).update(stale=True)
+        self.assertFalse(Census.objects.is_voter(1, 9))
+        created, bitmap, expires = CensusSnapshot.loaded[1]
+        CensusSnapshot.loaded[1] = (created, bitmap, 0)
+        self.assertTrue(Census.objects.is_voter(1, 9))
+
+    def test_census_operations(self):
+        for voting_id, voters in ((2, [1, 2, 3]), (3, [2, 3, 4]), (4, [5])):
+            for voter_id in voters:
+                Census(voting_id=voting_id, voter_id=voter_id).save()
+
+        def voters(voting_id):
+            return sorted(Census.objects.filter(voting_id=voting_id)
+                                        .values_list('voter_id', flat=True))
+
+        data = {'op': 'union', 'votings': [2, 3]}
+        response = self.client.post('/census/{}/operation/'.format(4), data, format='json')
+        self.assertEqual(response.status_code, 401)
+
+        self.login()
+        response = self.client.post('/census/{}/operation/'.format(4), data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'added': 4})
+        self.assertEqual(voters(4), [1, 2, 3, 4, 5])
+
+        data = {'op': 'intersect', 'votings': [2, 3]}
+        response = self.client.post('/census/{}/operation/'.format(5), data, format='json')
+        self.assertEqual(voters(5), [2, 3])
+
+        data = {'op': 'subtract', 'votings': [2, 3]}
+        response = self.client.post('/census/{}/operation/'.format(5), data, format='json')
+        self.assertEqual(response.json(), {'added': 1})
+        self.assertEqual(voters(5), [1, 2, 3])
+
+        data = {'op': 'clone', 'votings': [3]}
+        response = self.client.post('/census/{}/operation/'.format(5), data, format='json')
+        self.assertEqual(voters(5), [2, 3, 4])
+
+        for data in ({'op': 'clone', 'votings': [5]}, {'op': 'xor', 'votings': [2]},
+                     {'op': 'union', 'votings': []}):
+            response = self.client.post('/census/{}/operation/'.format(5), data, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_list_voting_pages(self):
+        for voter_id in (5, 3, 2):
+            Census(voting_id=1, voter_id=voter_id).save()
+
+        self.login()
+        response = self.client.get('/census/?voting_id={}&limit=2'.format(1), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'voters': [1, 2], 'next': 2})
+
+        response = self.client.get('/census/?voting_id={}&limit=2&after=2'.format(1), format='json')
+        self.assertEqual(response.json(), {'voters': [3, 5], 'next': 5})
+
+        response = self.client.get('/census/?voting_id={}&limit=2&after=5'.format(1), format='json')
+        self.assertEqual(response.json(), {'voters': [], 'next': None})
+
+        for limit in ('0', '-1', 'abc'):
+            response = self.client.get('/census/?voting_id=1&limit={}'.format(limit), format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_export(self):
+        Census(voting_id=1, voter_id=3).save()
+        response = self.client.get('/census/{}/export/'.format(1))
+        self.assertEqual(response.status_code, 401)
+
+        self.login()
+        response = self.client.get('/census/{}/export/'.format(1))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'1\n3\n')
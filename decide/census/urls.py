@@ -5,4 +5,8 @@ from . import views
 urlpatterns = [
     path('', views.CensusCreate.as_view(), name='census_create'),
     path('<int:voting_id>/', views.CensusDetail.as_view(), name='census_detail'),
+    path('<int:voting_id>/check/', views.CensusCheck.as_view(), name='census_check'),
+    path('<int:voting_id>/export/', views.CensusExport.as_view(), name='census_export'),
+    path('<int:voting_id>/operation/', views.CensusOperation.as_view(), name='census_operation'),
+    path('<int:voting_id>/snapshot/', views.CensusSnapshotView.as_view(), name='census_snapshot'),
 ]
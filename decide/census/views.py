@@ -1,17 +1,22 @@
+from django.conf import settings
 from django.db.utils import IntegrityError
-from django.core.exceptions import ObjectDoesNotExist
+from django.http import StreamingHttpResponse
 from rest_framework import generics
+from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.status import (
         HTTP_201_CREATED as ST_201,
         HTTP_204_NO_CONTENT as ST_204,
         HTTP_400_BAD_REQUEST as ST_400,
         HTTP_401_UNAUTHORIZED as ST_401,
+        HTTP_404_NOT_FOUND as ST_404,
         HTTP_409_CONFLICT as ST_409
 )
 
+from base import mods
 from base.perms import UserIsStaff
-from .models import Census
+from .models import CENSUS_OPERATIONS, Census, CensusSnapshot
+from store.models import Vote
 
 
 class CensusCreate(generics.ListCreateAPIView):
@@ -29,9 +34,33 @@ class CensusCreate(generics.ListCreateAPIView):
         return Response('Census created', status=ST_201)
 
     def list(self, request, *args, **kwargs):
+        """
+         * voting_id: id
+         * limit: int / nullable, page size up to settings.CENSUS_MAX_BATCH
+         * after: int / nullable, last voter_id of the previous page
+
+        If limit is given, the voters are paginated by voter_id and next is
+        the after value of the next page, null in the last page.
+        """
+
         voting_id = request.GET.get('voting_id')
         voters = Census.objects.filter(voting_id=voting_id).values_list('voter_id', flat=True)
-        return Response({'voters': voters})
+
+        limit = request.GET.get('limit')
+        if limit is None:
+            return Response({'voters': voters})
+
+        try:
+            limit = min(int(limit), settings.CENSUS_MAX_BATCH)
+            after = int(request.GET.get('after', -1))
+        except ValueError:
+            return Response('Invalid page', status=ST_400)
+        if limit < 1:
+            return Response('Invalid page', status=ST_400)
+
+        page = list(voters.filter(voter_id__gt=after).order_by('voter_id')[:limit])
+        last = page[-1] if len(page) == limit else None
+        return Response({'voters': page, 'next': last})
 
 
 class CensusDetail(generics.RetrieveDestroyAPIView):
@@ -43,9 +72,102 @@ class CensusDetail(generics.RetrieveDestroyAPIView):
         return Response('Voters deleted from census', status=ST_204)
 
     def retrieve(self, request, voting_id, *args, **kwargs):
-        voter = request.GET.get('voter_id')
         try:
-            Census.objects.get(voting_id=voting_id, voter_id=voter)
-        except ObjectDoesNotExist:
+            voter = int(request.GET.get('voter_id'))
+        except (TypeError, ValueError):
+            return Response('Invalid voter', status=ST_400)
+        if not Census.objects.is_voter(voting_id, voter):
             return Response('Invalid voter', status=ST_401)
         return Response('Valid voter')
+
+
+class CensusCheck(APIView):
+    permission_classes = (UserIsStaff,)
+
+    def post(self, request, voting_id):
+        """
+         * voters: [ int ], up to settings.CENSUS_MAX_BATCH ids
+
+        Returns the voters that are in the census of the voting.
+        """
+
+        voters = request.data.get('voters')
+        if not isinstance(voters, list) or len(voters) > settings.CENSUS_MAX_BATCH:
+            return Response('Invalid voters list', status=ST_400)
+        try:
+            voters = [int(v) for v in voters]
+        except (TypeError, ValueError):
+            return Response('Invalid voters list', status=ST_400)
+
+        present = Census.objects.voters_in(voting_id, voters)
+        return Response({'voters': sorted(present)})
+
+
+class CensusExport(APIView):
+    permission_classes = (UserIsStaff,)
+
+    def get(self, request, voting_id):
+        """
+        Streams the census voters of the voting, one voter_id per line
+        """
+
+        voters = (Census.objects.filter(voting_id=voting_id)
+                                .order_by('voter_id')
+                                .values_list('voter_id', flat=True)
+                                .iterator(chunk_size=settings.CENSUS_MAX_BATCH))
+        lines = ('{}\n'.format(v) for v in voters)
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+
+class CensusOperation(APIView):
+    permission_classes = (UserIsStaff,)
+
+    def post(self, request, voting_id):
+        """
+         * op: clone | union | intersect | subtract
+         * votings: [ int ], source votings
+
+        Adds to this voting census the result of the op over the census of
+        the source votings.
+        """
+
+        op = request.data.get('op')
+        sources = request.data.get('votings')
+        if op not in CENSUS_OPERATIONS or not isinstance(sources, list) or not sources:
+            return Response('Invalid census operation', status=ST_400)
+        try:
+            sources = [int(v) for v in sources]
+        except (TypeError, ValueError):
+            return Response('Invalid census operation', status=ST_400)
+        if voting_id in sources:
+            return Response('Invalid census operation', status=ST_400)
+
+        added = Census.objects.operation(op, voting_id, sources)
+        return Response({'added': added}, status=ST_201)
+
+
+class CensusSnapshotView(APIView):
+    permission_classes = (UserIsStaff,)
+
+    def get(self, request, voting_id):
+        """
+        Returns the census size and the turnout, the number of census voters
+        that have voted
+        """
+
+        snapshot = CensusSnapshot.get(voting_id, wait=True)
+        if snapshot is None:
+            return Response('Census snapshot not found', status=ST_404)
+
+        if 'store' in settings.MODULES:
+            voters = Vote.objects.filter(voting_id=voting_id).values_list('voter_id', flat=True)
+        else:
+            votes = mods.get('store', params={'voting_id': voting_id},
+                             HTTP_AUTHORIZATION='Token ' + request.auth.key)
+            voters = [v['voter_id'] for v in votes]
+
+        return Response({'size': len(snapshot), 'turnout': snapshot.count(voters)})
+
+    def post(self, request, voting_id):
+        snapshot = CensusSnapshot.build(voting_id)
+        return Response({'size': len(snapshot)}, status=ST_201)
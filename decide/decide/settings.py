@@ -242,6 +242,87 @@ MEDIAFILES_DIRS = (
 
 # number of bits for the key, all auths should use the same number of bits
 KEYBITS = 256
+# bits of the prime order q of g, p = kq + 1, the exponents are taken mod q
+# so they only have KEYQBITS. Only used when it's less than KEYBITS, if not
+# p is a safe prime, p = 2q + 1. The Schnorr groups can't encrypt the option
+# numbers, so they are only used for the homomorphic votings
+KEYQBITS = 0
+# elliptic curve of the new mixnet keys instead of a finite field group,
+# 'P-256' or empty, see mixnet.ec. The booth doesn't encrypt over curves yet
+MIXNET_CURVE = ''
+
+# max number of voters that can be sent in a single census request
+CENSUS_MAX_BATCH = 1000
+
+# seconds that a loaded census snapshot is used without checking that it's
+# the last one, and if the stale snapshots are rebuilt by the web process in
+# a thread. If not, the census is queried until they're rebuilt with the api
+CENSUS_SNAPSHOT_TTL = 5
+CENSUS_SNAPSHOT_IN_BACKGROUND = False
+
+# max number of voters that can be registered in a single bulk request
+REGISTER_MAX_BATCH = 10000
+
+# max number of cached token users and seconds that they are kept in memory
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 60
+
+# key used to sign the voter tokens and seconds that they are valid
+VOTER_TOKEN_KEY = SECRET_KEY
+VOTER_TOKEN_MAX_AGE = 24 * 60 * 60
+
+# max number of cached serialized votings and seconds that they are kept in
+# memory, the cache is invalidated when the voting changes
+VOTING_CACHE_SIZE = 1000
+VOTING_CACHE_TTL = 60
+
+# telegram notifications, queued and sent by the sendtelegram command. The
+# url can be pointed to a local stand-in of the telegram api
+TELEGRAM_URL = 'https://api.telegram.org/bot{key}/sendMessage'
+TELEGRAM_CHAT_ID = '-1001460398324'
+TELEGRAM_TIMEOUT = 5
+TELEGRAM_MAX_ATTEMPTS = 5
+# max number of queued messages sent in each run, telegram allows 20 messages
+# per minute in a group, and max length of a message
+TELEGRAM_BATCH = 20
+TELEGRAM_MAX_LENGTH = 4096
+
+# number of votings whose keys are asked to the mixnet at the same time when
+# starting many votings, see voting.batch
+VOTING_START_WORKERS = 8
+
+# max number of voting tallies run at the same time, each one in a process,
+# and if the tallies scheduled from the admin are run by the web process. If
+# not, they are run by the tally command, the tally process of the Procfile
+TALLY_WORKERS = 4
+TALLY_IN_BACKGROUND = False
+
+# allow homomorphic votings, whose ballots have no validity proofs yet, see
+# voting.models.Voting.clean
+HOMOMORPHIC_VOTINGS = False
+
+# seconds after which a running tally is considered dead, like when its
+# worker is killed, and marked as failed so it can be scheduled again
+TALLY_TIMEOUT = 60 * 60
+
+# decrypt the tally asking all the auths at the same time instead of chaining
+# them, with at most MIXNET_WORKERS concurrent requests to the auths
+MIXNET_PARALLEL_DECRYPT = True
+MIXNET_WORKERS = 8
+
+# number of auths needed to decrypt the votings with several auths, their key
+# is generated by all the auths and any MIXNET_THRESHOLD of them can decrypt.
+# With 0 all the auths are needed
+MIXNET_THRESHOLD = 0
+
+# number of votes read from the database in each chunk of the voting export
+EXPORT_CHUNK_SIZE = 2000
+
+# seconds that the booth page context of a voting is kept in memory
+BOOTH_CACHE_TTL = 60 * 60
+
+# max number of GET responses with ETag kept by mods to do conditional requests
+RESPONSE_CACHE_SIZE = 1000
 
 # Versioning
 ALLOWED_VERSIONS = ['v1', 'v2']
@@ -0,0 +1,203 @@
+'''
+Arithmetic of the NIST P-256 curve, y^2 = x^3 - 3x + b mod p, used by the
+elliptic curve ElGamal of the mixnet. The affine points are (x, y) tuples,
+None is the point at infinity, and they are encoded as the int of their 33
+bytes SEC1 compressed encoding, so they can be stored and sent like the
+finite field ElGamal values.
+
+>>> P7 = mul(G, 7)
+>>> decode(encode(P7)) == P7
+True
+>>> add(mul(G, 3), mul(G, 4)) == P7
+True
+>>> mul(G, N) is None
+True
+>>> decode_message(encode_message(42))
+42
+'''
+
+P = 0xffffffff00000001000000000000000000000000ffffffffffffffffffffffff
+A = P - 3
+B = 0x5ac635d8aa3a93e7b3ebbd55769886bc651d06b0cc53b0f63bce3c3e27d2604b
+N = 0xffffffff00000000ffffffffffffffffbce6faada7179e84f3b9cac2fc632551
+G = (0x6b17d1f2e12c4247f8bce6e563a440f277037d812deb33a0f4a13945d898c296,
+     0x4fe342e2fe1a7f9b8ee7eb4a7c0f9e162bce33576b315ececbb6406837bf51f5)
+
+NAME = 'P-256'
+
+# the messages are encoded in the x coordinate, shifted to try MESSAGE_TRIES
+# values until one of them is in the curve
+MESSAGE_SHIFT = 8
+MESSAGE_TRIES = 1 << MESSAGE_SHIFT
+
+
+def on_curve(point):
+    x, y = point
+    return (y * y - (x * x * x + A * x + B)) % P == 0
+
+
+def neg(point):
+    if point is None:
+        return None
+    x, y = point
+    return x, (-y) % P
+
+
+def _double(X, Y, Z):
+    # jacobian doubling with a = -3
+    if not Y:
+        return 0, 1, 0
+    YY = (Y * Y) % P
+    S = (4 * X * YY) % P
+    ZZ = (Z * Z) % P
+    M = (3 * (X - ZZ) * (X + ZZ)) % P
+    X3 = (M * M - 2 * S) % P
+    Y3 = (M * (S - X3) - 8 * YY * YY) % P
+    Z3 = (2 * Y * Z) % P
+    return X3, Y3, Z3
+
+
+def _add(X1, Y1, Z1, x2, y2):
+    # jacobian + affine
+    if not Z1:
+        return x2, y2, 1
+    Z1Z1 = (Z1 * Z1) % P
+    U2 = (x2 * Z1Z1) % P
+    S2 = (y2 * Z1 * Z1Z1) % P
+    H = (U2 - X1) % P
+    R = (S2 - Y1) % P
+    if not H:
+        if not R:
+            return _double(X1, Y1, Z1)
+        return 0, 1, 0
+    HH = (H * H) % P
+    HHH = (H * HH) % P
+    V = (X1 * HH) % P
+    X3 = (R * R - HHH - 2 * V) % P
+    Y3 = (R * (V - X3) - Y1 * HHH) % P
+    Z3 = (Z1 * H) % P
+    return X3, Y3, Z3
+
+
+def _affine(X, Y, Z):
+    if not Z:
+        return None
+    zinv = pow(Z, P - 2, P)
+    zinv2 = (zinv * zinv) % P
+    return (X * zinv2) % P, (Y * zinv2 * zinv) % P
+
+
+def add(p1, p2):
+    if p1 is None:
+        return p2
+    if p2 is None:
+        return p1
+    return _affine(*_add(p1[0], p1[1], 1, p2[0], p2[1]))
+
+
+def mul(point, k):
+    '''
+    k * point, double and add in jacobian coordinates with a single
+    inversion at the end
+    '''
+
+    k = int(k) % N
+    if point is None or not k:
+        return None
+    x, y = point
+    X, Y, Z = 0, 1, 0
+    for bit in bin(k)[2:]:
+        X, Y, Z = _double(X, Y, Z)
+        if bit == '1':
+            X, Y, Z = _add(X, Y, Z, x, y)
+    return _affine(X, Y, Z)
+
+
+def _powers(point):
+    powers = []
+    for i in range(256):
+        powers.append(point)
+        point = add(point, point)
+    return powers
+
+
+# G, 2G, 4G, ..., to multiply G with additions only
+_G_POWERS = _powers(G)
+
+
+def mul_base(k):
+    '''
+    k * G, with the precomputed doublings of G
+
+    >>> mul_base(12345) == mul(G, 12345)
+    True
+    '''
+
+    k = int(k) % N
+    X, Y, Z = 0, 1, 0
+    for i in range(k.bit_length()):
+        if (k >> i) & 1:
+            x, y = _G_POWERS[i]
+            X, Y, Z = _add(X, Y, Z, x, y)
+    return _affine(X, Y, Z)
+
+
+def sqrt(v):
+    # p = 3 mod 4
+    r = pow(v, (P + 1) // 4, P)
+    return r if (r * r) % P == v % P else None
+
+
+def encode(point):
+    if point is None:
+        return 0
+    x, y = point
+    return ((2 + (y & 1)) << 256) | x
+
+
+def decode(value):
+    '''
+    Point of the encoding, raises ValueError if it isn't a point of the
+    curve. The curve has prime order, so every point is in the group. The
+    point at infinity, 0, is never a key nor a ciphertext component, and
+    it's rejected too.
+    '''
+
+    value = int(value)
+    prefix, x = value >> 256, value & ((1 << 256) - 1)
+    if prefix not in (2, 3) or x >= P:
+        raise ValueError("invalid point")
+    y = sqrt(x * x * x + A * x + B)
+    if y is None:
+        raise ValueError("invalid point")
+    if (y & 1) != (prefix & 1):
+        y = P - y
+    return x, y
+
+
+def encode_message(m):
+    '''
+    Point with x = m * 2^MESSAGE_SHIFT + i, for the first i that gives a
+    point of the curve. Raises ValueError if x can be P or more.
+
+    >>> encode_message(P >> MESSAGE_SHIFT)
+    Traceback (most recent call last):
+    ...
+    ValueError: the message is too large
+    '''
+
+    m = int(m)
+    if m < 0 or (m + 1) << MESSAGE_SHIFT > P:
+        raise ValueError("the message is too large")
+    for i in range(MESSAGE_TRIES):
+        x = (m << MESSAGE_SHIFT) + i
+        y = sqrt(x * x * x + A * x + B)
+        if y is not None:
+            return x, y
+    raise ValueError("the message can't be encoded")
+
+
+def decode_message(point):
+    if point is None:
+        raise ValueError("invalid point")
+    return point[0] >> MESSAGE_SHIFT
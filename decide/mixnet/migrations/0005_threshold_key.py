@@ -0,0 +1,39 @@
+# Generated by Django 2.0 on 2026-10-19 18:06
+
+import base.models
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0004_auto_20180605_0842'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DKGShare',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('voting_id', models.PositiveIntegerField()),
+                ('position', models.PositiveIntegerField()),
+                ('sender', models.PositiveIntegerField()),
+                ('share', base.models.BigBigField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='mixnet',
+            name='participants',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='mixnet',
+            name='threshold',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dkgshare',
+            unique_together={('voting_id', 'position', 'sender')},
+        ),
+    ]
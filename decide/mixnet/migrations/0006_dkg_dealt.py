@@ -0,0 +1,19 @@
+# Generated by Django 2.0 on 2026-10-19 18:56
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mixnet', '0005_threshold_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mixnet',
+            name='dealt',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -39,14 +39,91 @@ from pprint import pprint
 from Crypto.PublicKey import ElGamal
 from Crypto.Random import random
 from Crypto import Random
-from Crypto.Util.number import GCD
+from Crypto.Util.number import getPrime, isPrime
 
+from mixnet import ec
 
-def rand(p):
+
+def rand(q):
+    '''
+    Random exponent, the exponents are only needed mod q, the order of g
+    '''
+
+    return random.StrongRandom().randint(2, int(q) - 1)
+
+
+def gen_group(bits, qbits):
+    '''
+    Schnorr group, p = kq + 1 with a p of bits and a prime q of qbits, and g
+    of order q. The exponents only have qbits, so with p of 2048 bits and q
+    of 256 bits each exponentiation is much faster than with a safe prime.
+    '''
+
+    randfunc = Random.new().read
+    q = getPrime(qbits, randfunc=randfunc)
     while True:
-        k = random.StrongRandom().randint(1, int(p) - 1)
-        if GCD(k, int(p) - 1) == 1: break
-    return k
+        k = random.StrongRandom().getrandbits(bits - qbits) | (1 << (bits - qbits - 1))
+        k -= k % 2
+        p = k * q + 1
+        if p.bit_length() == bits and isPrime(p, randfunc=randfunc):
+            break
+
+    while True:
+        g = pow(random.StrongRandom().randint(2, p - 2), k, p)
+        if g != 1:
+            return p, q, g
+
+
+def jacobi(a, n):
+    '''
+    Jacobi symbol (a/n) for an odd n, the Legendre symbol if n is prime
+
+    >>> [jacobi(a, 23) for a in (4, 5, 23)]
+    [1, -1, 0]
+    '''
+
+    a, n = int(a) % int(n), int(n)
+    result = 1
+    while a:
+        while not a & 1:
+            a >>= 1
+            if n & 7 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a & 3 == 3 and n & 3 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def in_group(v, p, q):
+    '''
+    Checks that v is in the subgroup of order q, the secret exponents are
+    only applied to the elements of the subgroup, so that nothing of them
+    is leaked in the other subgroups. With a safe prime the subgroup is the
+    quadratic residues, checked with the Legendre symbol instead of a full
+    length exponentiation.
+
+    >>> in_group(4, 23, 11), in_group(5, 23, 11), in_group(23, 23, 11)
+    (True, False, False)
+    >>> in_group(4, 47, 23), in_group(5, 47, 23), in_group(47, 47, 23)
+    (True, False, False)
+    '''
+
+    v, p, q = int(v), int(p), int(q)
+    if not 0 < v < p:
+        return False
+    if q == group_order(p):
+        return jacobi(v, p) == 1
+    return pow(v, q, p) == 1
+
+
+def key_order(k):
+    '''
+    Order of g of the key k, the keys without q use a safe prime
+    '''
+
+    return int(getattr(k, 'q', 0) or group_order(k.p))
 
 
 def gen_multiple_key(*crypts):
@@ -103,43 +180,288 @@ def multiple_decrypt_shuffle2(ciphers, *crypts, pubkey=None):
     return b
 
 
+def multiply_ciphers(ciphers, p):
+    '''
+    Product of the ciphertexts, that decrypts to the product of the clear
+    messages. With exponential ElGamal, where the message m is encrypted as
+    g^m, it decrypts to g^(sum of the messages).
+
+    >>> p, g, x = 23, 5, 3
+    >>> y = pow(g, x, p)
+    >>> encrypt = lambda m, r: (pow(g, r, p), m * pow(y, r, p) % p)
+    >>> ciphers = [encrypt(pow(g, m, p), r) for m, r in ((1, 2), (0, 7), (1, 4), (1, 9))]
+    >>> a, b = multiply_ciphers(ciphers, p)
+    >>> b * pow(a, p - 1 - x, p) % p == pow(g, 3, p)
+    True
+    '''
+
+    p = int(p)
+    a, b = 1, 1
+    for ca, cb in ciphers:
+        a = (a * int(ca)) % p
+        b = (b * int(cb)) % p
+    return a, b
+
+
+def small_dlog(g, values, p, maxm):
+    '''
+    For each value h returns m such that g^m = h mod p, with 0 <= m <= maxm,
+    or None if there's no such m. Baby-step giant-step, with a lookup table
+    of sqrt(maxm) powers of g, so it's only feasible for small m, like the
+    number of votes.
+
+    >>> small_dlog(5, [10, 1, 7], 23, 5)
+    [3, 0, None]
+    '''
+
+    g, p = int(g), int(p)
+    n = int(maxm ** 0.5) + 1
+
+    table = {}
+    e = 1
+    for j in range(n):
+        table.setdefault(e, j)
+        e = (e * g) % p
+    # g^-n, to do the giant steps
+    giant = pow(e, p - 2, p)
+
+    result = []
+    for h in values:
+        h = int(h) % p
+        m = None
+        for i in range(n + 1):
+            if h in table:
+                m = i * n + table[h]
+                break
+            h = (h * giant) % p
+        result.append(m if m is not None and m <= maxm else None)
+    return result
+
+
+def batch_inverse(values, p):
+    '''
+    Modular inverses of all the values with a single modular inversion and
+    3(n - 1) multiplications (Montgomery's trick).
+
+    >>> batch_inverse([2, 3, 5, 22], 23)
+    [12, 8, 14, 22]
+    '''
+
+    p = int(p)
+    prefix = []
+    acc = 1
+    for v in values:
+        acc = (acc * int(v)) % p
+        prefix.append(acc)
+    if not prefix:
+        return []
+
+    inv = pow(acc, p - 2, p)
+    result = [0] * len(values)
+    for i in range(len(values) - 1, 0, -1):
+        result[i] = (inv * prefix[i - 1]) % p
+        inv = (inv * int(values[i])) % p
+    result[0] = inv
+    return result
+
+
+def combine_partials(msgs, shares, p):
+    '''
+    Decrypts the ciphertexts with the partial decryptions of every auth,
+    where each auth share is the list of a^x_i for each ciphertext (a, b).
+    The clear message is b / (a^x_1 * ... * a^x_n).
+
+    >>> p, g, x1, x2 = 23, 5, 3, 7
+    >>> y = pow(g, x1 + x2, p)
+    >>> msgs = [(pow(g, r, p), m * pow(y, r, p) % p) for m, r in ((2, 4), (9, 6))]
+    >>> shares = [[pow(a, x, p) for a, b in msgs] for x in (x1, x2)]
+    >>> combine_partials(msgs, shares, p)
+    [2, 9]
+    '''
+
+    p = int(p)
+    factors = []
+    for i in range(len(msgs)):
+        d = 1
+        for share in shares:
+            d = (d * int(share[i])) % p
+        factors.append(d)
+    return [(int(b) * inv) % p for (a, b), inv in zip(msgs, batch_inverse(factors, p))]
+
+
+def group_order(p):
+    '''
+    Order of the subgroup of g for a safe prime, p = 2q + 1, where g is a
+    quadratic residue
+    '''
+
+    return (int(p) - 1) // 2
+
+
+def gen_polynomial(t, q):
+    '''
+    Random polynomial of degree t - 1 over Z_q, the coefficients from the
+    lowest degree, the first one is the secret of the dealer
+    '''
+
+    return [random.StrongRandom().randint(1, int(q) - 1) for i in range(t)]
+
+
+def eval_polynomial(coeffs, x, q):
+    '''
+    >>> eval_polynomial([3, 2, 1], 2, 11)
+    0
+    '''
+
+    result = 0
+    for c in reversed(coeffs):
+        result = (result * x + c) % q
+    return result
+
+
+def verify_share(share, index, commitments, p, g):
+    '''
+    Checks the share of the auth index against the commitments of the
+    dealer, g^a_k for each coefficient: g^share == prod(C_k^(index^k))
+
+    >>> p, q, g = 23, 11, 4
+    >>> coeffs = [3, 2, 1]
+    >>> commitments = [pow(g, c, p) for c in coeffs]
+    >>> verify_share(eval_polynomial(coeffs, 5, q), 5, commitments, p, g)
+    True
+    >>> verify_share(eval_polynomial(coeffs, 5, q) + 1, 5, commitments, p, g)
+    False
+    '''
+
+    p = int(p)
+    expected = 1
+    for k, c in enumerate(commitments):
+        expected = (expected * pow(int(c), index ** k, p)) % p
+    return pow(int(g), int(share), p) == expected
+
+
+def lagrange_coefficients(indexes, q):
+    '''
+    Coefficients to interpolate at 0 the polynomial from its values at the
+    indexes, the key x = sum(l_i * x_i) for the shares x_i of any t auths.
+
+    >>> q, coeffs = 11, [3, 2, 1]
+    >>> ls = lagrange_coefficients([1, 3, 4], q)
+    >>> sum(l * eval_polynomial(coeffs, i, q) for l, i in zip(ls, [1, 3, 4])) % q
+    3
+    '''
+
+    q = int(q)
+    coefficients = []
+    for i in indexes:
+        num, den = 1, 1
+        for j in indexes:
+            if j != i:
+                num = (num * j) % q
+                den = (den * (j - i)) % q
+        coefficients.append((num * pow(den, q - 2, q)) % q)
+    return coefficients
+
+
 class MixCrypt:
-    def __init__(self, k=None, bits=256):
+    def __init__(self, k=None, bits=256, qbits=0, key=None):
         self.bits = bits
-        if k:
-            self.k = self.getk(k.p, k.g)
+        self.qbits = qbits
+        if key:
+            self.setk(key.p, key.g, key.y, key.x, key.q)
+        elif k:
+            self.k = self.getk(k.p, k.g, key_order(k))
         else:
             self.k = self.genk()
 
     def genk(self):
-        self.k = ElGamal.generate(self.bits, Random.new().read)
-        return self.k
-
-    def getk(self, p, g):
-        x = rand(p)
-        y = pow(g, x, p)
-        self.k = ElGamal.construct((p, g, y, x))
-        return self.k
+        '''
+        New group and key, a Schnorr group if qbits is less than bits, if not
+        a safe prime
+        '''
 
-    def setk(self, p, g, y, x):
+        if self.qbits and self.qbits < self.bits:
+            p, q, g = gen_group(self.bits, self.qbits)
+        else:
+            k = ElGamal.generate(self.bits, Random.new().read)
+            p, g = int(k.p), int(k.g)
+            q = group_order(p)
+        return self.getk(p, g, q)
+
+    def getk(self, p, g, q=None):
+        q = int(q or group_order(p))
+        x = rand(q)
+        y = pow(int(g), x, int(p))
+        return self.setk(p, g, y, x, q)
+
+    def setk(self, p, g, y, x, q=None):
         self.k = ElGamal.construct((p, g, y, x))
+        self.k.q = int(q or group_order(p))
         return self.k
 
     def encrypt(self, m, k=None):
-        r = rand(self.k.p)
+        '''
+        With a Schnorr group only the messages of the subgroup, like the g^m
+        of the homomorphic votings, can be encrypted. The ciphertext of any
+        other message leaks it, b^q is m^q.
+        '''
+
         if not k:
             k = self.k
-        a, b = k._encrypt(m, r)
-        return a, b
+        p, q = int(k.p), key_order(k)
+        if q != group_order(p) and not in_group(m, p, q):
+            raise ValueError("the message is not in the group")
+        r = rand(q)
+        return pow(int(k.g), r, p), (int(m) * pow(int(k.y), r, p)) % p
 
-    def decrypt(self, c):
-        m = self.k._decrypt(c)
-        return m
+    def decrypt(self, c, last=True):
+        '''
+        b / a^x, that is b * a^(q - x) for the a in the subgroup. The clear
+        message is the same group element for the last auth and the rest.
+        '''
+
+        a, b = map(int, c)
+        p, q = int(self.k.p), key_order(self.k)
+        if q != group_order(p) and not in_group(a, p, q):
+            raise ValueError("the ciphertext is not in the group")
+        return (b * pow(a, q - int(self.k.x) % q, p)) % p
+
+    def partial_decrypt(self, msgs):
+        '''
+        Share of this key in the decryption of each message, a^x
+        '''
+
+        p, q, x = int(self.k.p), key_order(self.k), int(self.k.x)
+        if not all(in_group(a, p, q) for a, b in msgs):
+            raise ValueError("the ciphertext is not in the group")
+        return [pow(int(a), x, p) for a, b in msgs]
+
+    def combine(self, msgs, shares, coefficients=None):
+        '''
+        Decrypts the messages with the partial decryptions of the auths, each
+        share raised to its coefficient if there are coefficients
+        '''
+
+        p = int(self.k.p)
+        if coefficients:
+            shares = [[pow(int(d), l, p) for d in share] for l, share in zip(coefficients, shares)]
+        return combine_partials(msgs, shares, p)
+
+    def join_pubkeys(self, ys):
+        '''
+        Public key of the sum of the private keys of the ys
+        '''
+
+        p = int(self.k.p)
+        y = 1
+        for v in ys:
+            y = (y * int(v)) % p
+        return y
 
     def multiple_decrypt(self, msgs, last=True):
         msgs2 = []
         for a, b in msgs:
-            clear = self.decrypt((a, b))
+            clear = self.decrypt((a, b), last)
             if last:
                 msg = clear
             else:
@@ -153,7 +475,7 @@ class MixCrypt:
         while msgs2:
             n = random.StrongRandom().randint(0, len(msgs2) - 1)
             a, b = msgs2.pop(n)
-            clear = self.decrypt((a, b))
+            clear = self.decrypt((a, b), last)
             if last:
                 msg = clear
             else:
@@ -178,16 +500,15 @@ class MixCrypt:
         '''
 
         if pubkey:
-            p, g, y = pubkey
-            k = ElGamal.construct((p, g, y))
+            p, g, y = map(int, pubkey)
         else:
-            k = self.k
+            p, g, y = int(self.k.p), int(self.k.g), int(self.k.y)
+        # the auths of a mixnet share the group of the key
+        q = key_order(self.k) if p == int(self.k.p) else group_order(p)
 
         a, b = map(int, cipher)
-        a1, b1 = map(int, self.encrypt(1, k=k))
-        p = int(k.p)
-
-        return ((a * a1) % p, (b * b1) % p)
+        r = rand(q)
+        return ((a * pow(g, r, p)) % p, (b * pow(y, r, p)) % p)
 
     def gen_perm(self, l):
         x = list(range(l))
@@ -213,6 +534,108 @@ class MixCrypt:
         return msgs2
 
 
+class ECKey:
+    '''
+    Key of the P-256 curve with the attributes of the ElGamal keys, p is the
+    prime of the field, g the generator, q its order, and g and y are
+    encoded points, see mixnet.ec
+    '''
+
+    curve = ec.NAME
+
+    def __init__(self, y, x=None):
+        self.p, self.g, self.q = ec.P, ec.encode(ec.G), ec.N
+        self.y, self.x = int(y), x
+
+
+class ECMixCrypt(MixCrypt):
+    '''
+    ElGamal over the P-256 curve, each ciphertext (a, b) is a pair of
+    encoded points, a = rG and b = M + rY, where M is the point of the
+    message. The points are 33 bytes, and each operation is a scalar
+    multiplication over a 256 bits field.
+
+    >>> k = ECMixCrypt()
+    >>> cipher = [k.encrypt(m) for m in (2, 3, 4)]
+    >>> [k.decrypt(c) for c in k.shuffle(cipher)] != [2, 3, 4]
+    True
+    >>> sorted(k.multiple_decrypt(k.shuffle(cipher)))
+    [2, 3, 4]
+    '''
+
+    def __init__(self, k=None, key=None):
+        super().__init__(k=k, bits=256, key=key)
+
+    def genk(self):
+        return self.getk(ec.P, ec.encode(ec.G))
+
+    def getk(self, p, g, q=None):
+        x = rand(ec.N)
+        return self.setk(p, g, ec.encode(ec.mul_base(x)), x)
+
+    def setk(self, p, g, y, x, q=None):
+        self.k = ECKey(y, x)
+        return self.k
+
+    def encrypt(self, m, k=None):
+        if not k:
+            k = self.k
+        r = rand(ec.N)
+        b = ec.add(ec.encode_message(m), ec.mul(ec.decode(k.y), r))
+        return ec.encode(ec.mul_base(r)), ec.encode(b)
+
+    def decrypt(self, c, last=True):
+        '''
+        b - xa, the message of the point is only decoded by the last auth
+        '''
+
+        a, b = map(ec.decode, c)
+        clear = ec.add(b, ec.neg(ec.mul(a, self.k.x)))
+        if last:
+            return ec.decode_message(clear)
+        return ec.encode(clear)
+
+    def partial_decrypt(self, msgs):
+        x = int(self.k.x)
+        return [ec.encode(ec.mul(ec.decode(a), x)) for a, b in msgs]
+
+    def combine(self, msgs, shares, coefficients=None):
+        coefficients = coefficients or [1] * len(shares)
+        result = []
+        for i, (a, b) in enumerate(msgs):
+            d = None
+            for l, share in zip(coefficients, shares):
+                d = ec.add(d, ec.mul(ec.decode(share[i]), l))
+            result.append(ec.decode_message(ec.add(ec.decode(b), ec.neg(d))))
+        return result
+
+    def join_pubkeys(self, ys):
+        y = None
+        for v in ys:
+            y = ec.add(y, ec.decode(v))
+        return ec.encode(y)
+
+    def reencrypt(self, cipher, pubkey=None):
+        y = pubkey[2] if pubkey else self.k.y
+        r = rand(ec.N)
+        a, b = map(ec.decode, cipher)
+        a = ec.add(a, ec.mul_base(r))
+        b = ec.add(b, ec.mul(ec.decode(y), r))
+        return ec.encode(a), ec.encode(b)
+
+
+def get_crypt(key, bits=256):
+    '''
+    MixCrypt of the stored key, over the curve of the key if it has one
+    '''
+
+    if not getattr(key, 'curve', ''):
+        return MixCrypt(bits=bits, key=key)
+    if key.curve != ec.NAME:
+        raise ValueError("unknown curve {}".format(key.curve))
+    return ECMixCrypt(key=key)
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -1,15 +1,91 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from django.contrib.postgres.fields import JSONField
 from django.db import models
 
-from .mixcrypt import MixCrypt
+from .mixcrypt import ECMixCrypt, MixCrypt, get_crypt, group_order, key_order, lagrange_coefficients
+from .mixcrypt import eval_polynomial, gen_polynomial, verify_share
 
 from base import mods
-from base.models import Auth, Key
+from base.models import Auth, BigBigField, Key
 from base.serializers import AuthSerializer
 from django.conf import settings
 
 
 # number of bits for the key, all auths should use the same number of bits
 B = settings.KEYBITS
+Q = settings.KEYQBITS
+
+logger = logging.getLogger(__name__)
+
+
+def run_concurrently(calls, needed=0):
+    '''
+    Runs the calls, functions without params, at the same time with at most
+    MIXNET_WORKERS threads, and returns their results, None for the calls
+    that fail. With needed, returns as soon as that number of calls succeed
+    without waiting for the rest, that are left as None.
+    '''
+
+    results = [None] * len(calls)
+    done = 0
+
+    def call(f):
+        try:
+            return f()
+        # a malformed answer of an auth is a failed call too
+        except (requests.RequestException, ValueError, KeyError, TypeError):
+            return None
+
+    if settings.MIXNET_WORKERS == 1 or len(calls) < 2:
+        for i, f in enumerate(calls):
+            results[i] = call(f)
+            done += results[i] is not None
+            if needed and done >= needed:
+                break
+        return results
+
+    pool = ThreadPoolExecutor(max_workers=min(settings.MIXNET_WORKERS, len(calls)))
+    futures = {pool.submit(call, f): i for i, f in enumerate(calls)}
+    for future in as_completed(futures):
+        results[futures[future]] = future.result()
+        done += results[futures[future]] is not None
+        if needed and done >= needed:
+            break
+    # the slow auths are not waited
+    pool.shutdown(wait=False)
+    return results
+
+
+def post_auth(url, path, data):
+    '''
+    Posts to the mixnet of an auth, raising ValueError if it doesn't answer
+    with a 200
+    '''
+
+    response = mods.post('mixnet', entry_point=path, baseurl=url, json=data, response=True)
+    if response.status_code != 200:
+        raise ValueError("{}{}: {}".format(url, path, response.status_code))
+    return response.json()
+
+
+def valid_share(share, msgs):
+    # a partial decryption has a value for each message
+    if not isinstance(share, list) or len(share) != len(msgs):
+        raise ValueError("invalid partial decryption")
+    return share
+
+
+def share_digest(share):
+    '''
+    Digest of a share of the key generation, kept by the dealer to confirm
+    the shares that it sent without keeping the shares
+    '''
+
+    return hashlib.sha256(str(int(share)).encode()).hexdigest()
 
 
 class Mixnet(models.Model):
@@ -22,6 +98,13 @@ class Mixnet(models.Model):
     pubkey = models.ForeignKey(Key, blank=True, null=True,
                                related_name="mixnets_pub",
                                on_delete=models.SET_NULL)
+    # threshold key, any t auths can decrypt, and the url of each auth
+    # by position, the share of each auth is the polynomial at position + 1
+    threshold = models.PositiveIntegerField(default=0)
+    participants = JSONField(blank=True, default=list)
+    # digests of the shares dealt to each auth by position, until the key is
+    # finished, the auths confirm the shares they receive with the dealer
+    dealt = JSONField(blank=True, default=dict)
 
     def __str__(self):
         auths = ", ".join(a.name for a in self.auths.all())
@@ -29,36 +112,216 @@ class Mixnet(models.Model):
                                                           auths, self.pubkey)
 
     def shuffle(self, msgs, pk):
-        crypt = MixCrypt(bits=B)
-        k = crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
+        crypt = get_crypt(self.key, B)
 
         return crypt.shuffle(msgs, pk)
 
-    def decrypt(self, msgs, pk, last=False):
-        crypt = MixCrypt(bits=B)
-        k = crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
+    def decrypt(self, msgs, pk, last=False, keep_order=False):
+        crypt = get_crypt(self.key, B)
+        if keep_order:
+            return crypt.multiple_decrypt(msgs, last)
         return crypt.shuffle_decrypt(msgs, last)
 
-    def gen_key(self, p=0, g=0):
-        crypt = MixCrypt(bits=B)
+    def partial_decrypt(self, msgs):
+        crypt = get_crypt(self.key, B)
+        return crypt.partial_decrypt(msgs)
+
+    def parallel_decrypt(self, msgs):
+        '''
+        Asks all the next auths for their partial decryption at the same
+        time, instead of chaining the decryption through them, and decrypts
+        the messages with the shares of all the auths.
+        '''
+
+        if self.threshold:
+            return self.threshold_decrypt(msgs)
+
+        path = "/partial/{}/".format(self.voting_id)
+        # the key is read here, the calls are run in other threads
+        crypt = get_crypt(self.key, B)
+        auths = [(self.auth_position + i + 1, a.url) for i, a in enumerate(self.next_auths())]
+
+        def partial(position, url):
+            data = {"msgs": msgs, "position": position}
+            return lambda: valid_share(post_auth(url, path, data), msgs)
+
+        # the requests are done while this auth computes its share
+        calls = [partial(position, url) for position, url in auths]
+        calls.append(lambda: crypt.partial_decrypt(msgs))
+        shares = run_concurrently(calls)
+        own = shares.pop()
+        if own is None:
+            raise ValueError("invalid messages")
+        failed = [url for (position, url), share in zip(auths, shares) if share is None]
+        if failed:
+            raise ValueError("{} failed the partial decryption".format(", ".join(failed)))
+
+        return crypt.combine(msgs, [own] + shares)
+
+    def threshold_decrypt(self, msgs):
+        '''
+        Decrypts with the partial decryptions of the first t auths that
+        answer, the offline or slow auths are not waited. Each share a^x_i is
+        raised to its Lagrange coefficient, so the product is a^x.
+
+        Raises ValueError if less than t auths answer.
+        '''
+
+        path = "/partial/{}/".format(self.voting_id)
+        # the key is read here, the calls are run in other threads
+        crypt = get_crypt(self.key, B)
+
+        def partial(position, url):
+            if position == self.auth_position:
+                return lambda: crypt.partial_decrypt(msgs)
+            data = {"msgs": msgs, "position": position}
+            return lambda: valid_share(post_auth(url, path, data), msgs)
+
+        calls = [partial(i, url) for i, url in enumerate(self.participants)]
+        results = run_concurrently(calls, needed=self.threshold)
+        answered = [(i + 1, r) for i, r in enumerate(results) if r is not None]
+        if len(answered) < self.threshold:
+            raise ValueError("{} of {} auths needed to decrypt".format(len(answered),
+                                                                       self.threshold))
+
+        answered = answered[:self.threshold]
+        ls = lagrange_coefficients([i for i, r in answered], key_order(crypt.k))
+        return crypt.combine(msgs, [share for i, share in answered], ls)
+
+    def gen_key(self, p=0, g=0, q=0, curve='', qbits=Q):
         if self.key:
-            k = crypt.setk(self.key.p, self.key.g, self.key.y, self.key.x)
-        elif (not g or not p):
-            k = crypt.genk()
-            key = Key(p=int(k.p), g=int(k.g), y=int(k.y), x=int(k.x))
-            key.save()
-
-            self.key = key
-            self.save()
+            return
+
+        if curve:
+            k = ECMixCrypt().k
+        elif not p or not g:
+            k = MixCrypt(bits=B, qbits=qbits).k
         else:
-            k = crypt.getk(p, g)
-            key = Key(p=int(k.p), g=int(k.g), y=int(k.y), x=int(k.x))
-            key.save()
+            k = MixCrypt(k=Key(p=p, g=g, q=q), bits=B).k
+        self.key = Key.objects.create(p=int(k.p), g=int(k.g), y=int(k.y), x=int(k.x), q=k.q,
+                                      curve=getattr(k, 'curve', ''))
+        self.save()
+
+    def gen_threshold_key(self, p=0, g=0, q=0, qbits=Q):
+        '''
+        Distributed key generation, each auth deals the shares of a random
+        polynomial of degree t - 1 to all the auths, and the share of each
+        auth of the key is the sum of the shares that it receives. The key,
+        the sum of the secrets of all the auths, is never known by anyone,
+        and any t auths can decrypt. The mixnets of all the auths are
+        created first, so every auth knows the participants whose shares it
+        accepts, and then all the auths deal and finish at the same time.
+
+        Raises ValueError if any auth fails.
+        '''
 
-            self.key = key
-            self.save()
+        if not p or not g:
+            k = MixCrypt(bits=B, qbits=qbits).k
+            p, g, q = int(k.p), int(k.g), k.q
+        q = int(q or group_order(p))
+
+        auths = [{"name": a.name, "url": a.url} for a in self.auths.all()]
+        path = "/dkg/{}/".format(self.voting_id)
+
+        def create(position, url):
+            data = {"auths": auths, "position": position, "threshold": self.threshold}
+            return lambda: post_auth(url, path, data)
+
+        def deal(position, url):
+            data = {"auths": auths, "position": position, "threshold": self.threshold,
+                    "key": {"p": p, "g": g, "q": q}}
+            return lambda: post_auth(url, path, data)["commitments"]
+
+        remote = [(i, url) for i, url in enumerate(self.participants) if i != self.auth_position]
+        for (i, url), r in zip(remote, run_concurrently([create(i, url) for i, url in remote])):
+            if r is None:
+                raise ValueError("{} failed creating its mixnet".format(url))
+
+        commitments = [None] * len(self.participants)
+        commitments[self.auth_position] = self.deal(p, g, q)
+        for (i, url), c in zip(remote, run_concurrently([deal(i, url) for i, url in remote])):
+            if c is None:
+                raise ValueError("{} failed dealing the shares".format(url))
+            commitments[i] = c
+
+        def finish(position, url):
+            data = {"position": position, "key": {"p": p, "g": g, "q": q}, "commitments": commitments}
+            return lambda: post_auth(url, path + "finish/", data)
+
+        pubkey = self.finish(p, g, q, commitments)
+        for (i, url), r in zip(remote, run_concurrently([finish(i, url) for i, url in remote])):
+            if r is None or int(r["y"]) != pubkey.y:
+                raise ValueError("{} failed verifying the shares".format(url))
+
+        return pubkey
+
+    def deal(self, p, g, q):
+        '''
+        Sends to each auth its share of a random polynomial f, f(position + 1),
+        and returns the commitments to the coefficients, g^a_k, that the
+        auths use to verify the shares.
+        '''
+
+        coeffs = gen_polynomial(self.threshold, q)
+        path = "/dkg/{}/share/".format(self.voting_id)
+        remote = [(i, url) for i, url in enumerate(self.participants) if i != self.auth_position]
+        shares = {i: eval_polynomial(coeffs, i + 1, q) for i, url in remote}
+
+        # saved before sending, the auths confirm the shares as they arrive
+        self.dealt = {str(i): share_digest(share) for i, share in shares.items()}
+        self.save(update_fields=["dealt"])
+
+        def send(position, url):
+            data = {"position": position, "sender": self.auth_position,
+                    "share": shares[position]}
+            return lambda: post_auth(url, path, data)
+
+        for (i, url), r in zip(remote, run_concurrently([send(i, url) for i, url in remote])):
+            if r is None:
+                raise ValueError("{} failed receiving its share".format(url))
+
+        DKGShare.objects.update_or_create(
+            voting_id=self.voting_id, position=self.auth_position, sender=self.auth_position,
+            defaults={"share": eval_polynomial(coeffs, self.auth_position + 1, q)})
+
+        return [pow(g, c, p) for c in coeffs]
+
+    def finish(self, p, g, q, commitments):
+        '''
+        Verifies the received shares against the commitments of each dealer
+        and saves the share of this auth of the key, and the public key, the
+        product of the commitments to the dealers secrets.
+
+        Raises ValueError with the dealers of the invalid shares.
+        '''
+
+        if not isinstance(commitments, list) or len(commitments) != len(self.participants):
+            raise ValueError("a commitment is needed from each auth")
+
+        received = DKGShare.objects.filter(voting_id=self.voting_id, position=self.auth_position)
+        shares = {s.sender: s.share for s in received}
+        index = self.auth_position + 1
+        invalid = [sender for sender, c in enumerate(commitments)
+                   if sender not in shares or not verify_share(shares[sender], index, c, p, g)]
+        if invalid:
+            raise ValueError("invalid shares from the auths {}".format(invalid))
+
+        x = sum(shares[sender] for sender in range(len(commitments))) % q
+        y = 1
+        for c in commitments:
+            y = (y * int(c[0])) % p
+
+        self.key = Key.objects.create(p=p, g=g, y=pow(g, x, p), x=x, q=q)
+        self.pubkey = Key.objects.create(p=p, g=g, y=y, q=q)
+        self.dealt = {}
+        self.save()
+        received.delete()
+        return self.pubkey
 
     def chain_call(self, path, data):
+        if self.threshold:
+            return self.threshold_chain_call(path, data)
+
         next_auths=self.next_auths()
 
         data.update({
@@ -75,6 +338,29 @@ class Mixnet(models.Model):
 
         return None
 
+    def threshold_chain_call(self, path, data):
+        '''
+        Calls the next auth that answers, skipping the offline ones. With
+        mixed in data, the number of auths that took part in the chain up to
+        this one, the last auth raises ValueError if they are less than t.
+        '''
+
+        data["voting"] = self.voting_id
+        for position in range(self.auth_position + 1, len(self.participants)):
+            data["position"] = position
+            url = self.participants[position]
+            try:
+                return post_auth(url, path, data)
+            except (requests.RequestException, ValueError) as e:
+                logger.warning("voting %s: skipping the auth %s in %s: %s",
+                               self.voting_id, url, path, e)
+                continue
+
+        mixed = data.get("mixed", self.threshold)
+        if mixed < self.threshold:
+            raise ValueError("{} of {} auths needed took part".format(mixed, self.threshold))
+        return None
+
     def next_auths(self):
         next_auths = self.auths.filter(me=False)
 
@@ -82,3 +368,18 @@ class Mixnet(models.Model):
             next_auths = next_auths[1:]
 
         return next_auths
+
+
+class DKGShare(models.Model):
+    '''
+    Share of the key generation received by the auth in position from the
+    auth in position sender, kept until the key is finished
+    '''
+
+    voting_id = models.PositiveIntegerField()
+    position = models.PositiveIntegerField()
+    sender = models.PositiveIntegerField()
+    share = BigBigField()
+
+    class Meta:
+        unique_together = (('voting_id', 'position', 'sender'),)
@@ -2,6 +2,7 @@ from django.test import TestCase
 from django.conf import settings
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
+from django.test.utils import override_settings
 
 from mixnet.mixcrypt import MixCrypt
 from mixnet.mixcrypt import ElGamal
@@ -188,3 +189,229 @@ class MixnetCase(APITestCase):
 
         self.assertNotEqual(clear, clear1)
         self.assertEqual(sorted(clear), sorted(clear1))
+
+    # the auths requests are done in this thread, with the test db
+    @override_settings(MIXNET_WORKERS=1)
+    def test_parallel_decrypt(self):
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+
+        clear = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]
+        encrypt = self.encrypt_msgs(clear, pk)
+
+        data = { "msgs": encrypt, "pk": key }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        shuffled = response.json()
+
+        data = { "msgs": shuffled, "pk": key, "parallel": True }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
+        data = { "msgs": encrypt, "parallel": True, "keep_order": True }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(clear, response.json())
+
+        # all the auths are needed, the failures aren't combined
+        from mixnet.models import Mixnet
+        Mixnet.objects.filter(voting_id=1, auth_position=1).delete()
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('http://127.0.0.1:8000 failed', response.json())
+
+
+    # the auths requests are done in this thread, with the test db
+    @override_settings(MIXNET_WORKERS=1)
+    def test_threshold_key(self):
+        from mixnet.models import DKGShare, Mixnet, share_digest
+
+        auths = [
+            { "name": "auth1", "url": "http://localhost:8000" },
+            { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            { "name": "auth3", "url": "http://127.0.1.1:8000" },
+        ]
+        data = { "voting": 1, "threshold": 2, "auths": auths }
+        response = self.client.post('/mixnet/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+        self.assertEqual(Mixnet.objects.filter(voting_id=1).count(), 3)
+        self.assertFalse(DKGShare.objects.exists())
+
+        clear = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]
+        encrypt = self.encrypt_msgs(clear, pk)
+
+        response = self.client.post('/mixnet/shuffle/1/', { "msgs": encrypt }, format='json')
+        shuffled = response.json()
+        self.assertNotEqual(shuffled, encrypt)
+
+        response = self.client.post('/mixnet/decrypt/1/', { "msgs": shuffled }, format='json')
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
+        # any two auths can decrypt
+        Mixnet.objects.filter(voting_id=1, auth_position=1).delete()
+        data = { "msgs": encrypt, "keep_order": True }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(clear, response.json())
+        response = self.client.post('/mixnet/shuffle/1/', { "msgs": encrypt }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        Mixnet.objects.filter(voting_id=1, auth_position=2).delete()
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        # nor shuffle with less than t auths
+        response = self.client.post('/mixnet/shuffle/1/', { "msgs": encrypt }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        data = { "voting": 2, "threshold": 4, "auths": auths }
+        response = self.client.post('/mixnet/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        data["threshold"] = -1
+        response = self.client.post('/mixnet/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Mixnet.objects.filter(voting_id=2).exists())
+
+        # only the shares of the participants are received, before the key
+        data = { "position": 0, "sender": 5, "share": 1 }
+        response = self.client.post('/mixnet/dkg/1/share/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        data["sender"] = 1
+        response = self.client.post('/mixnet/dkg/1/share/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/mixnet/dkg/3/share/', data, format='json')
+        self.assertEqual(response.status_code, 404)
+
+        data = { "auths": auths, "position": 0, "threshold": 4 }
+        response = self.client.post('/mixnet/dkg/4/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        data["threshold"] = "x"
+        response = self.client.post('/mixnet/dkg/4/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Mixnet.objects.filter(voting_id=4).exists())
+
+        # only the shares that the sender confirms are received, and they
+        # replace the shares of anyone else
+        participants = [a["url"] for a in auths]
+        Mixnet.objects.create(voting_id=4, auth_position=0, threshold=2,
+                              participants=participants)
+        Mixnet.objects.create(voting_id=4, auth_position=1, threshold=2,
+                              participants=participants, dealt={"0": share_digest(7)})
+        data = { "position": 0, "sender": 1, "share": 5 }
+        response = self.client.post('/mixnet/dkg/4/share/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(DKGShare.objects.filter(voting_id=4).exists())
+        DKGShare.objects.create(voting_id=4, position=0, sender=1, share=5)
+        data["share"] = 7
+        response = self.client.post('/mixnet/dkg/4/share/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DKGShare.objects.get(voting_id=4).share, 7)
+
+        # the mixnet isn't left behind when the key generation fails, here
+        # the second auth doesn't accept the shares of the first one
+        Mixnet.objects.create(voting_id=3, auth_position=1, threshold=2, participants=[])
+        data = { "voting": 3, "threshold": 2, "auths": auths }
+        response = self.client.post('/mixnet/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Mixnet.objects.filter(voting_id=3, auth_position=0).exists())
+
+    def test_schnorr_group(self):
+        from mixnet.mixcrypt import in_group
+
+        crypt = MixCrypt(bits=512, qbits=160)
+        p, g, q = int(crypt.k.p), int(crypt.k.g), crypt.k.q
+        self.assertEqual(p.bit_length(), 512)
+        self.assertEqual(q.bit_length(), 160)
+        self.assertEqual((p - 1) % q, 0)
+        self.assertTrue(in_group(g, p, q))
+        self.assertLess(int(crypt.k.x), q)
+        # the messages out of the subgroup would be leaked
+        with self.assertRaises(ValueError):
+            crypt.encrypt(2)
+
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ],
+            "key": { "p": p, "g": g, "q": q },
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        pk = key["p"], key["g"], key["y"]
+        self.assertEqual(key["p"], p)
+
+        # only the elements of the subgroup, like the g^m of the homomorphic
+        # votes, are encrypted
+        clear = [pow(g, m, p) for m in range(2, 15)]
+        crypt.k.y = key["y"]
+        encrypt = [crypt.encrypt(m) for m in clear]
+
+        data = { "msgs": encrypt, "pk": key }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        shuffled = response.json()
+
+        data = { "msgs": shuffled, "pk": key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
+        # p - 1 has order 2, out of the subgroup
+        data = { "msgs": [[p - 1, 2]], "pk": key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    # the auths requests are done in this thread, with the test db
+    @override_settings(MIXNET_CURVE='P-256', MIXNET_WORKERS=1)
+    def test_elliptic_curve(self):
+        from mixnet.mixcrypt import ECKey, ECMixCrypt
+
+        data = {
+            "voting": 1,
+            "auths": [
+                { "name": "auth1", "url": "http://localhost:8000" },
+                { "name": "auth2", "url": "http://127.0.0.1:8000" },
+            ]
+        }
+        response = self.client.post('/mixnet/', data, format='json')
+        key = response.json()
+        self.assertEqual(key["curve"], "P-256")
+        self.assertLess(key["y"].bit_length(), 33 * 8)
+
+        clear = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]
+        k = ECMixCrypt()
+        encrypt = [k.encrypt(m, k=ECKey(key["y"])) for m in clear]
+
+        data = { "msgs": encrypt, "pk": key }
+        response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+        shuffled = response.json()
+        self.assertNotEqual(shuffled, encrypt)
+
+        data = { "msgs": shuffled, "pk": key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(sorted(clear), sorted(response.json()))
+
+        data = { "msgs": encrypt, "parallel": True, "keep_order": True }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(clear, response.json())
+
+        data = { "msgs": [[5, encrypt[0][1]]], "pk": key }
+        response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # nor the point at infinity
+        for msgs in ([[0, encrypt[0][1]]], [[encrypt[0][0], 0]]):
+            data = { "msgs": msgs, "pk": key }
+            response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+            self.assertEqual(response.status_code, 400)
+            response = self.client.post('/mixnet/shuffle/1/', data, format='json')
+            self.assertEqual(response.status_code, 400)
+            data = { "msgs": msgs, "parallel": True }
+            response = self.client.post('/mixnet/decrypt/1/', data, format='json')
+            self.assertEqual(response.status_code, 400)
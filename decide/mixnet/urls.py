@@ -9,4 +9,9 @@ urlpatterns = [
     path('', include(router.urls)),
     path('shuffle/<int:voting_id>/', views.Shuffle.as_view(), name='shuffle'),
     path('decrypt/<int:voting_id>/', views.Decrypt.as_view(), name='decrypt'),
+    path('partial/<int:voting_id>/', views.PartialDecrypt.as_view(), name='partial'),
+    path('dkg/<int:voting_id>/', views.DKGDeal.as_view(), name='dkg'),
+    path('dkg/<int:voting_id>/share/', views.DKGReceive.as_view(), name='dkg_share'),
+    path('dkg/<int:voting_id>/dealt/', views.DKGDealt.as_view(), name='dkg_dealt'),
+    path('dkg/<int:voting_id>/finish/', views.DKGFinish.as_view(), name='dkg_finish'),
 ]
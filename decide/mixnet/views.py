@@ -1,14 +1,28 @@
+import requests
 from django.conf import settings
+from Crypto.Random import random
 from django.shortcuts import get_object_or_404
-from rest_framework import viewsets
+from rest_framework import status, viewsets
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .mixcrypt import get_crypt
 from .serializers import MixnetSerializer
-from .models import Auth, Mixnet, Key
+from .models import Auth, DKGShare, Mixnet, Key, post_auth, share_digest
 from base.serializers import KeySerializer, AuthSerializer
 
 
+def get_auths(auths):
+    dbauths = []
+    for auth in auths:
+        isme = auth["url"] == settings.BASEURL
+        a, _ = Auth.objects.get_or_create(name=auth["name"],
+                                          url=auth["url"],
+                                          me=isme)
+        dbauths.append(a)
+    return dbauths
+
+
 class MixnetViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows mixnets to be viewed or edited.
@@ -23,40 +37,64 @@ class MixnetViewSet(viewsets.ModelViewSet):
          * auths: [ {"name": str, "url": str} ]
          * voting: id
          * position: int / nullable
-         * key: { "p": int, "g": int } / nullable
+         * key: { "p": int, "g": int, "q": int / nullable,
+                   "curve": str / nullable } / nullable
+         * threshold: int / nullable, generate a threshold key that any
+           threshold auths can decrypt, instead of needing all of them
+         * qbits: int / nullable, bits of the order of g without key, a
+           Schnorr group if it's less than the key bits, by default
+           settings.KEYQBITS, 0 for a safe prime
+
+        Without key, the key is generated over settings.MIXNET_CURVE if it's
+        set, see mixnet.ec
         """
 
         auths = request.data.get("auths")
         voting = request.data.get("voting")
         key = request.data.get("key", {"p": 0, "g": 0})
         position = request.data.get("position", 0)
-        p, g = int(key["p"]), int(key["g"])
+        try:
+            threshold = int(request.data.get("threshold", 0))
+            qbits = int(request.data.get("qbits", settings.KEYQBITS))
+            p, g, q = int(key["p"]), int(key["g"]), int(key.get("q") or 0)
+        except (TypeError, ValueError):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        curve = key.get("curve", "") if p else settings.MIXNET_CURVE
 
-        dbauths = []
-        for auth in auths:
-            isme = auth["url"] == settings.BASEURL
-            a, _ = Auth.objects.get_or_create(name=auth["name"],
-                                              url=auth["url"],
-                                              me=isme)
-            dbauths.append(a)
+        # the threshold keys are only generated in finite field groups
+        if not 0 <= threshold <= len(auths) or (threshold and curve):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
 
-        mn = Mixnet(voting_id=voting, auth_position=position)
+        dbauths = get_auths(auths)
+
+        mn = Mixnet(voting_id=voting, auth_position=position, threshold=threshold,
+                    participants=[a["url"] for a in auths] if threshold else [])
         mn.save()
 
         for a in dbauths:
             mn.auths.add(a)
 
-        mn.gen_key(p, g)
+        if threshold:
+            try:
+                pubkey = mn.gen_threshold_key(p, g, q, qbits)
+            except ValueError as e:
+                # the voting can ask for the key again
+                DKGShare.objects.filter(voting_id=voting, position=position).delete()
+                mn.delete()
+                return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+            return Response(KeySerializer(pubkey, many=False).data)
+
+        mn.gen_key(p, g, q, curve, qbits)
 
-        data = { "key": { "p": mn.key.p, "g": mn.key.g } }
+        data = { "key": { "p": mn.key.p, "g": mn.key.g, "q": mn.key.q, "curve": mn.key.curve } }
         # chained call to the next auth to gen the key
         resp = mn.chain_call("/", data)
         if resp:
-            y = (resp["y"] * mn.key.y) % mn.key.p
+            y = get_crypt(mn.key).join_pubkeys([resp["y"], mn.key.y])
         else:
             y = mn.key.y
 
-        pubkey = Key(p=mn.key.p, g=mn.key.g, y=y)
+        pubkey = Key(p=mn.key.p, g=mn.key.g, y=y, q=mn.key.q, curve=mn.key.curve)
         pubkey.save()
         mn.pubkey = pubkey
         mn.save()
@@ -72,26 +110,42 @@ class Shuffle(APIView):
          * msgs: [ [int, int] ]
          * pk: { "p": int, "g": int, "y": int } / nullable
          * position: int / nullable
+         * mixed: int / nullable, the number of auths that shuffled before,
+           a threshold key needs t of them
         """
 
         position = request.data.get("position", 0)
         mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
 
+        try:
+            mixed = int(request.data.get("mixed", 0)) + 1
+        except (TypeError, ValueError):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
         msgs = request.data.get("msgs", [])
         pk = request.data.get("pk", None)
         if pk:
             p, g, y = pk["p"], pk["g"], pk["y"]
+        elif mn.threshold:
+            p, g, y = mn.pubkey.p, mn.pubkey.g, mn.pubkey.y
         else:
             p, g, y = mn.key.p, mn.key.g, mn.key.y
 
-        msgs = mn.shuffle(msgs, (p, g, y))
+        try:
+            msgs = mn.shuffle(msgs, (p, g, y))
+        except ValueError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
 
         data = {
             "msgs": msgs,
             "pk": { "p": p, "g": g, "y": y },
+            "mixed": mixed,
         }
         # chained call to the next auth to gen the key
-        resp = mn.chain_call("/shuffle/{}/".format(voting_id), data)
+        try:
+            resp = mn.chain_call("/shuffle/{}/".format(voting_id), data)
+        except ValueError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
         if resp:
             msgs = resp
 
@@ -106,6 +160,10 @@ class Decrypt(APIView):
          * msgs: [ [int, int] ]
          * pk: { "p": int, "g": int, "y": int } / nullable
          * position: int / nullable
+         * keep_order: bool / nullable, decrypt without shuffling, used to
+           decrypt the aggregates of homomorphic votings
+         * parallel: bool / nullable, decrypt with the partial decryptions of
+           all the auths requested at the same time, instead of chaining
         """
 
         position = request.data.get("position", 0)
@@ -117,6 +175,17 @@ class Decrypt(APIView):
             p, g, y = pk["p"], pk["g"], pk["y"]
         else:
             p, g, y = mn.key.p, mn.key.g, mn.key.y
+        keep_order = request.data.get("keep_order", False)
+
+        # a threshold key is only decrypted with the shares of t auths
+        if request.data.get("parallel", False) or mn.threshold:
+            try:
+                msgs = mn.parallel_decrypt(msgs)
+            except ValueError as e:
+                return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+            if not keep_order:
+                random.shuffle(msgs)
+            return Response(msgs)
 
         next_auths = mn.next_auths()
         last = next_auths.count() == 0
@@ -124,11 +193,15 @@ class Decrypt(APIView):
         # useful for tests only, to override the last value
         last = request.data.get("force-last", last)
 
-        msgs = mn.decrypt(msgs, (p, g, y), last=last)
+        try:
+            msgs = mn.decrypt(msgs, (p, g, y), last=last, keep_order=keep_order)
+        except ValueError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
 
         data = {
             "msgs": msgs,
             "pk": { "p": p, "g": g, "y": y },
+            "keep_order": keep_order,
         }
         # chained call to the next auth to gen the key
         resp = mn.chain_call("/decrypt/{}/".format(voting_id), data)
@@ -136,3 +209,149 @@ class Decrypt(APIView):
             msgs = resp
 
         return  Response(msgs)
+
+
+class PartialDecrypt(APIView):
+
+    def post(self, request, voting_id):
+        """
+         * voting_id: id
+         * msgs: [ [int, int] ]
+         * position: int / nullable
+
+        Returns the share of this auth in the decryption of each message
+        """
+
+        position = request.data.get("position", 0)
+        mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
+        try:
+            return Response(mn.partial_decrypt(request.data.get("msgs", [])))
+        except ValueError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+
+
+
+class DKGDeal(APIView):
+
+    def post(self, request, voting_id):
+        """
+         * voting_id: id
+         * auths: [ {"name": str, "url": str} ]
+         * position: int
+         * threshold: int
+         * key: { "p": int, "g": int, "q": int } / nullable
+
+        Creates the mixnet of this auth, and with the key deals the shares of
+        the threshold key to all the auths, returns the commitments to the
+        polynomial
+        """
+
+        auths = request.data.get("auths")
+        key = request.data.get("key")
+        try:
+            position = int(request.data.get("position"))
+            threshold = int(request.data.get("threshold"))
+            participants = [a["url"] for a in auths]
+        except (KeyError, TypeError, ValueError):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not 0 <= position < len(auths) or not 0 < threshold <= len(auths):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+        mn = Mixnet.objects.filter(voting_id=voting_id, auth_position=position).first()
+        if not mn:
+            mn = Mixnet(voting_id=voting_id, auth_position=position,
+                        threshold=threshold, participants=participants)
+            mn.save()
+            for a in get_auths(auths):
+                mn.auths.add(a)
+        if not key:
+            return Response({})
+
+        try:
+            commitments = mn.deal(int(key["p"]), int(key["g"]), int(key["q"]))
+        except ValueError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+        return Response({"commitments": commitments})
+
+
+class DKGReceive(APIView):
+
+    def post(self, request, voting_id):
+        """
+         * voting_id: id
+         * position: int, the auth that receives the share
+         * sender: int, the auth that deals the share
+         * share: int
+
+        Only the shares of the other participants of the threshold key are
+        accepted, and only if the sender confirms that it dealt them, a
+        confirmed share replaces the previous one
+        """
+
+        try:
+            position = int(request.data.get("position"))
+            sender = int(request.data.get("sender"))
+            share = int(request.data.get("share"))
+        except (TypeError, ValueError):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+        mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
+        if mn.key or sender == position or not 0 <= sender < len(mn.participants):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = {"position": sender, "receiver": position, "digest": share_digest(share)}
+        try:
+            post_auth(mn.participants[sender], "/dkg/{}/dealt/".format(voting_id), data)
+        except (requests.RequestException, ValueError):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+        DKGShare.objects.update_or_create(
+            voting_id=voting_id, position=position, sender=sender,
+            defaults={"share": share})
+        return Response({})
+
+
+class DKGDealt(APIView):
+
+    def post(self, request, voting_id):
+        """
+         * voting_id: id
+         * position: int, the auth that dealt the share
+         * receiver: int, the auth that received the share
+         * digest: str, the digest of the received share
+
+        Confirms that this auth dealt the share, answers 200 only if it's the
+        share dealt to the receiver
+        """
+
+        position = request.data.get("position", 0)
+        mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
+        receiver = str(request.data.get("receiver"))
+        digest = request.data.get("digest")
+        if not digest or mn.dealt.get(receiver) != digest:
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({})
+
+
+class DKGFinish(APIView):
+
+    def post(self, request, voting_id):
+        """
+         * voting_id: id
+         * position: int
+         * key: { "p": int, "g": int, "q": int }
+         * commitments: [ [int] ], the commitments of each auth by position
+
+        Verifies the received shares and saves the key, returns the public key
+        """
+
+        position = request.data.get("position", 0)
+        mn = get_object_or_404(Mixnet, voting_id=voting_id, auth_position=position)
+        key = request.data.get("key")
+        try:
+            pubkey = mn.finish(int(key["p"]), int(key["g"]), int(key["q"]),
+                               request.data.get("commitments"))
+        except ValueError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+        return Response(KeySerializer(pubkey, many=False).data)
@@ -1,3 +1,20 @@
+import hashlib
+import json
+
 from django.db import models
+from django.contrib.postgres.fields import JSONField
+
+
+class PostProcResult(models.Model):
+    '''
+    Result of a postproc, stored by the digest of its type and params
+    '''
+
+    digest = models.CharField(max_length=64, unique=True)
+    result = JSONField()
+    created = models.DateTimeField(auto_now_add=True)
 
-# Create your models here.
+    @staticmethod
+    def make_digest(params):
+        data = json.dumps(params, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
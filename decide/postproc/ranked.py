@@ -0,0 +1,143 @@
+'''
+Postprocessing of preference questions, where each ballot is a ranking of
+the options numbers, the most preferred first.
+
+The ballots are received grouped by ranking, [ {ranking: [int], votes: int} ],
+so every method works over the distinct rankings instead of every ballot.
+
+>>> ballots = [
+...     {'ranking': [1, 2, 3], 'votes': 5},
+...     {'ranking': [2, 3, 1], 'votes': 4},
+...     {'ranking': [3, 2, 1], 'votes': 2},
+... ]
+>>> borda([1, 2, 3], ballots)
+{1: 10, 2: 15, 3: 8}
+>>> irv([1, 2, 3], ballots)
+{1: 1, 2: 2, 3: 0}
+>>> schulze([1, 2, 3], ballots)
+{1: 0, 2: 2, 3: 1}
+'''
+
+from collections import defaultdict
+
+
+def group(numbers, ballots):
+    '''
+    Joins the equal rankings, discarding the unknown or repeated numbers
+    '''
+
+    valid = set(numbers)
+    grouped = defaultdict(int)
+    for b in ballots:
+        ranking = []
+        for n in b['ranking']:
+            if n in valid and n not in ranking:
+                ranking.append(n)
+        if ranking:
+            grouped[tuple(ranking)] += b['votes']
+    return grouped
+
+
+def borda(numbers, ballots):
+    '''
+    Each option gets n - 1 points for each first preference, n - 2 for each
+    second preference, etc. The not ranked options get no points.
+    '''
+
+    points = {n: 0 for n in numbers}
+    top = len(numbers) - 1
+    for ranking, votes in group(numbers, ballots).items():
+        for i, n in enumerate(ranking):
+            points[n] += (top - i) * votes
+    return points
+
+
+def irv(numbers, ballots):
+    '''
+    Instant-runoff voting, in each round the option with fewer first
+    preferences, between the not eliminated options, is eliminated until
+    one option has the majority.
+
+    Returns for each option the number of rounds that it survived, so the
+    winner has the highest value.
+    '''
+
+    rankings = group(numbers, ballots)
+    active = set(numbers)
+    survived = {n: 0 for n in numbers}
+
+    rnd = 0
+    while active:
+        firsts = {n: 0 for n in active}
+        for ranking, votes in rankings.items():
+            for n in ranking:
+                if n in active:
+                    firsts[n] += votes
+                    break
+
+        leader = max(active, key=lambda n: (firsts[n], -n))
+        if len(active) == 1 or firsts[leader] * 2 > sum(firsts.values()):
+            for n in active:
+                survived[n] = rnd
+            survived[leader] = rnd + 1
+            break
+
+        loser = min(active, key=lambda n: (firsts[n], -n))
+        active.remove(loser)
+        survived[loser] = rnd
+        rnd += 1
+
+        # the exhausted rankings are not needed in the next rounds
+        rankings = {r: v for r, v in rankings.items() if active.intersection(r)}
+
+    return survived
+
+
+def pairwise(numbers, ballots):
+    '''
+    Matrix d where d[i][j] is the number of voters that prefer the option i
+    over j, the not ranked options are preferred less than the ranked ones.
+    '''
+
+    idx = {n: i for i, n in enumerate(numbers)}
+    size = len(numbers)
+    d = [[0] * size for i in range(size)]
+    for ranking, votes in group(numbers, ballots).items():
+        ranked = [idx[n] for n in ranking]
+        unranked = set(range(size)).difference(ranked)
+        for pos, i in enumerate(ranked):
+            row = d[i]
+            for j in ranked[pos + 1:]:
+                row[j] += votes
+            for j in unranked:
+                row[j] += votes
+    return d
+
+
+def schulze(numbers, ballots):
+    '''
+    Schulze method, with the strongest paths between each pair of options.
+
+    Returns for each option the number of options that it beats, so the
+    winner has the highest value.
+    '''
+
+    d = pairwise(numbers, ballots)
+    size = len(numbers)
+    p = [[d[i][j] if d[i][j] > d[j][i] else 0 for j in range(size)] for i in range(size)]
+
+    for k in range(size):
+        pk = p[k]
+        for i in range(size):
+            if i == k:
+                continue
+            pik = p[i][k]
+            if not pik:
+                continue
+            pi = p[i]
+            for j in range(size):
+                if j != i and j != k:
+                    pi[j] = max(pi[j], min(pik, pk[j]))
+
+    return {n: sum(1 for j in range(size) if p[i][j] > p[j][i])
+            for i, n in enumerate(numbers)}
@@ -0,0 +1,83 @@
+'''
+Seats apportionment between options, each one gets seats in proportion to
+its votes.
+
+>>> votes = [340000, 280000, 160000, 60000, 15000]
+>>> dhondt(votes, 7)
+[3, 3, 1, 0, 0]
+>>> sainte_lague(votes, 7)
+[3, 2, 1, 1, 0]
+>>> hare(votes, 7)
+[3, 2, 1, 1, 0]
+>>> dhondt([0, 0], 3)
+[0, 0]
+'''
+
+import heapq
+
+
+def highest_averages(votes, seats, divisor):
+    '''
+    Each seat is given to the option with the highest votes / divisor(s),
+    where s is the number of seats that the option already has. The
+    quotients are kept in a heap, so it's O(seats log options).
+    '''
+
+    result = [0] * len(votes)
+    heap = [(-v / divisor(0), -v, i) for i, v in enumerate(votes) if v > 0]
+    heapq.heapify(heap)
+
+    for _ in range(seats):
+        if not heap:
+            break
+        _, v, i = heapq.heappop(heap)
+        result[i] += 1
+        heapq.heappush(heap, (v / divisor(result[i]), v, i))
+
+    return result
+
+
+def dhondt(votes, seats):
+    return highest_averages(votes, seats, lambda s: s + 1)
+
+
+def sainte_lague(votes, seats):
+    return highest_averages(votes, seats, lambda s: 2 * s + 1)
+
+
+def hare(votes, seats):
+    '''
+    Largest remainder with the Hare quota, total votes / seats. Each option
+    gets the integer part of its quota and the rest of the seats are given
+    to the options with the largest remainders.
+    '''
+
+    total = sum(votes)
+    if not total:
+        return [0] * len(votes)
+
+    result = [v * seats // total for v in votes]
+    remainders = ((v * seats % total, v, i) for i, v in enumerate(votes))
+    for _, _, i in heapq.nlargest(seats - sum(result), remainders):
+        result[i] += 1
+    return result
+
+
+def benchmark(options=1000, seats=100000):
+    import random
+    import time
+
+    votes = [random.randint(0, 10 ** 7) for i in range(options)]
+    for method in (dhondt, sainte_lague, hare):
+        start = time.perf_counter()
+        method(votes, seats)
+        elapsed = time.perf_counter() - start
+        print("{}: {} options, {} seats, {:.3f}s".format(method.__name__, options, seats, elapsed))
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    benchmark(options=50, seats=650)
+    benchmark(options=1000, seats=100000)
+    benchmark(options=100000, seats=100000)
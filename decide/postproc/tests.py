@@ -4,6 +4,7 @@ from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 
 from base import mods
+from .models import PostProcResult
 
 
 class PostProcTestCase(APITestCase):
@@ -42,3 +43,95 @@ class PostProcTestCase(APITestCase):
 
         values = response.json()
         self.assertEqual(values, expected_result)
+
+    def test_preference(self):
+        options = [
+            { 'option': 'Option 1', 'number': 1, 'votes': 5 },
+            { 'option': 'Option 2', 'number': 2, 'votes': 4 },
+            { 'option': 'Option 3', 'number': 3, 'votes': 2 },
+        ]
+        ballots = [
+            { 'ranking': [1, 2, 3], 'votes': 5 },
+            { 'ranking': [2, 3, 1], 'votes': 4 },
+            { 'ranking': [3, 2, 1], 'votes': 2 },
+        ]
+        expected = {
+            'BORDA': [(2, 15), (1, 10), (3, 8)],
+            'IRV': [(2, 2), (1, 1), (3, 0)],
+            'SCHULZE': [(2, 2), (3, 1), (1, 0)],
+        }
+
+        for t, result in expected.items():
+            data = { 'type': t, 'options': options, 'ballots': ballots }
+            response = self.client.post('/postproc/', data, format='json')
+            self.assertEqual(response.status_code, 200)
+
+            values = [(opt['number'], opt['postproc']) for opt in response.json()]
+            self.assertEqual(values, result)
+
+    def test_seats(self):
+        data = {
+            'seats': 7,
+            'options': [
+                { 'option': 'Option 1', 'number': 1, 'votes': 340000 },
+                { 'option': 'Option 2', 'number': 2, 'votes': 280000 },
+                { 'option': 'Option 3', 'number': 3, 'votes': 160000 },
+                { 'option': 'Option 4', 'number': 4, 'votes': 60000 },
+                { 'option': 'Option 5', 'number': 5, 'votes': 15000 },
+            ]
+        }
+        expected = {
+            'DHONDT': [3, 3, 1, 0, 0],
+            'SAINTE_LAGUE': [3, 2, 1, 1, 0],
+            'HARE': [3, 2, 1, 1, 0],
+        }
+
+        for t, result in expected.items():
+            data['type'] = t
+            response = self.client.post('/postproc/', data, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([opt['postproc'] for opt in response.json()], result)
+
+    def test_weight(self):
+        data = {
+            'type': 'WEIGHT',
+            'options': [
+                { 'option': 'Option 1', 'number': 1, 'votes': 5, 'weight': 1 },
+                { 'option': 'Option 2', 'number': 2, 'votes': 3, 'weight': 2 },
+            ]
+        }
+
+        response = self.client.post('/postproc/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(opt['number'], opt['postproc']) for opt in response.json()],
+                         [(2, 6), (1, 5)])
+
+    def test_cached_batch(self):
+        data = {
+            'types': ['IDENTITY', 'DHONDT'],
+            'seats': 2,
+            'options': [
+                { 'option': 'Option 1', 'number': 1, 'votes': 1 },
+                { 'option': 'Option 2', 'number': 2, 'votes': 3 },
+            ]
+        }
+
+        response = self.client.post('/postproc/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        values = response.json()
+        self.assertEqual(sorted(values), ['DHONDT', 'IDENTITY'])
+        self.assertEqual([opt['postproc'] for opt in values['IDENTITY']], [3, 1])
+        self.assertEqual([opt['postproc'] for opt in values['DHONDT']], [2, 0])
+        self.assertEqual(PostProcResult.objects.count(), 2)
+
+        data = {'type': 'DHONDT', 'seats': 2, 'options': data['options']}
+        response = self.client.post('/postproc/', data, format='json')
+        self.assertEqual(response.json(), values['DHONDT'])
+        self.assertEqual(PostProcResult.objects.count(), 2)
+
+        # the types are a list of known types and the seats a number
+        for invalid in ({'types': 'DHONDT'}, {'types': ['DHONDT', 'X']}, {'seats': 'x'},
+                        {'seats': -1}):
+            response = self.client.post('/postproc/', {**data, **invalid}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(PostProcResult.objects.count(), 2)
@@ -1,6 +1,13 @@
+from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 
+from . import ranked, seats
+from .models import PostProcResult
+
+
+TYPES = ('IDENTITY', 'WEIGHT', 'DHONDT', 'SAINTE_LAGUE', 'HARE', 'BORDA', 'IRV', 'SCHULZE')
+
 
 class PostProcView(APIView):
 
@@ -14,25 +21,122 @@ class PostProcView(APIView):
             })
 
         out.sort(key=lambda x: -x['postproc'])
-        return Response(out)
+        return out
+
+    def weight(self, options):
+        out = []
+
+        for opt in options:
+            out.append({
+                **opt,
+                'postproc': opt['votes'] * opt.get('weight', 1),
+            })
+
+        out.sort(key=lambda x: -x['postproc'])
+        return out
+
+    def apportion(self, method, options, nseats):
+        votes = [opt['votes'] * opt.get('weight', 1) for opt in options]
+        values = method(votes, nseats)
+        out = []
+
+        for opt, value in zip(options, values):
+            out.append({
+                **opt,
+                'postproc': value,
+            })
+
+        out.sort(key=lambda x: (-x['postproc'], -x['votes']))
+        return out
+
+    def ranked(self, method, options, ballots):
+        numbers = [opt['number'] for opt in options]
+        values = method(numbers, ballots)
+        out = []
+
+        for opt in options:
+            out.append({
+                **opt,
+                'postproc': values[opt['number']],
+            })
+
+        out.sort(key=lambda x: (-x['postproc'], -x['votes']))
+        return out
 
     def post(self, request):
         """
-         * type: IDENTITY | EQUALITY | WEIGHT
+         * type: IDENTITY | WEIGHT | DHONDT | SAINTE_LAGUE | HARE | BORDA | IRV | SCHULZE
          * options: [
             {
              option: str,
              number: int,
              votes: int,
+             weight: int / nullable, votes multiplier for WEIGHT and seats types
              ...extraparams
             }
            ]
+         * seats: int, only for seats types, number of seats to distribute
+         * types: [ str ] / nullable, to get the result of several types at
+           once, as { type: result }
+         * ballots: [ { ranking: [int], votes: int } ], only for preference
+           types, the options numbers of each ranking, the most preferred first
         """
 
+        types = request.data.get('types')
+        if types is not None and (not isinstance(types, list) or
+                                  not all(isinstance(t, str) and t in TYPES for t in types)):
+            return Response('Unknown postproc types', status=status.HTTP_400_BAD_REQUEST)
+        try:
+            nseats = int(request.data.get('seats', 0))
+        except (TypeError, ValueError):
+            return Response('Invalid number of seats', status=status.HTTP_400_BAD_REQUEST)
+        if nseats < 0:
+            return Response('Invalid number of seats', status=status.HTTP_400_BAD_REQUEST)
+
+        if types:
+            return Response({t: self.cached(t, request.data, nseats) for t in types})
+
         t = request.data.get('type', 'IDENTITY')
-        opts = request.data.get('options', [])
+        return Response(self.cached(t, request.data, nseats))
+
+    def cached(self, t, data, nseats=0):
+        """
+        The results are stored by the digest of the type and its params, so
+        the same postproc is only computed once
+        """
+
+        params = {
+            'type': t,
+            'options': data.get('options', []),
+            'ballots': data.get('ballots', []),
+            'seats': nseats,
+        }
+        digest = PostProcResult.make_digest(params)
+        result = PostProcResult.objects.filter(digest=digest).first()
+        if result:
+            return result.result
+
+        out = self.postproc(t, params['options'], params['ballots'], params['seats'])
+        if out is not None:
+            PostProcResult.objects.get_or_create(digest=digest, defaults={'result': out})
+        return out if out is not None else {}
 
+    def postproc(self, t, options, ballots, nseats):
         if t == 'IDENTITY':
-            return self.identity(opts)
+            return self.identity(options)
+        elif t == 'WEIGHT':
+            return self.weight(options)
+        elif t == 'DHONDT':
+            return self.apportion(seats.dhondt, options, nseats)
+        elif t == 'SAINTE_LAGUE':
+            return self.apportion(seats.sainte_lague, options, nseats)
+        elif t == 'HARE':
+            return self.apportion(seats.hare, options, nseats)
+        elif t == 'BORDA':
+            return self.ranked(ranked.borda, options, ballots)
+        elif t == 'IRV':
+            return self.ranked(ranked.irv, options, ballots)
+        elif t == 'SCHULZE':
+            return self.ranked(ranked.schulze, options, ballots)
 
-        return Response({})
+        return None
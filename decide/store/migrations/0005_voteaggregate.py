@@ -0,0 +1,23 @@
+# Generated by Django 2.0 on 2026-10-19 17:58
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_homomorphic'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('voting_id', models.PositiveIntegerField(unique=True)),
+                ('ciphers', django.contrib.postgres.fields.jsonb.JSONField()),
+                ('votes', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
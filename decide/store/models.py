@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.contrib.postgres.fields import JSONField
 from base.models import BigBigField
+from mixnet.mixcrypt import multiply_ciphers
 
 
 class Vote(models.Model):
@@ -8,8 +10,73 @@ class Vote(models.Model):
 
     a = BigBigField()
     b = BigBigField()
+    # [ [a, b] ] in homomorphic votings, a ciphertext for each option
+    ballot = JSONField(blank=True, null=True)
 
     voted = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return '{}: {}'.format(self.voting_id, self.voter_id)
+
+
+class VoteAggregate(models.Model):
+    '''
+    Product of the ballots of each option of a homomorphic voting, updated
+    with each vote, so the tally doesn't need to read the votes.
+    '''
+
+    voting_id = models.PositiveIntegerField(unique=True)
+    # [ [a, b] ], for each option
+    ciphers = JSONField()
+    votes = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def lock(cls, voting_id, noptions):
+        '''
+        Returns the aggregate of the voting locked until the end of the
+        transaction, so the votes of the voting are added one by one
+        '''
+
+        aggregate = cls.objects.select_for_update().filter(voting_id=voting_id).first()
+        if aggregate is None:
+            try:
+                with transaction.atomic():
+                    cls.objects.create(voting_id=voting_id, ciphers=[[1, 1]] * noptions)
+            except IntegrityError:
+                # created by a concurrent first vote of the voting
+                pass
+            aggregate = cls.objects.select_for_update().get(voting_id=voting_id)
+        return aggregate
+
+    def add(self, ballot, p, replaced=None):
+        '''
+        Multiplies the ballot into the aggregate. If the ballot replaces a
+        previous vote of the voter, the inverse of the replaced ballot is
+        multiplied too, so it's removed from the aggregate.
+        '''
+
+        p = int(p)
+        ciphers = [multiply_ciphers([c, b], p) for c, b in zip(self.ciphers, ballot)]
+        if replaced:
+            inverses = [(pow(int(a), p - 2, p), pow(int(b), p - 2, p)) for a, b in replaced]
+            ciphers = [multiply_ciphers([c, i], p) for c, i in zip(ciphers, inverses)]
+        else:
+            self.votes += 1
+        self.ciphers = [list(c) for c in ciphers]
+        self.save()
+
+    def verify(self, p):
+        '''
+        Checks the aggregate against the product of the stored ballots
+        '''
+
+        p = int(p)
+        ciphers = [[1, 1] for c in self.ciphers]
+        votes = 0
+        ballots = Vote.objects.filter(voting_id=self.voting_id, ballot__isnull=False) \
+                              .values_list('ballot', flat=True).iterator()
+        for ballot in ballots:
+            ciphers = [list(multiply_ciphers([c, b], p)) for c, b in zip(ciphers, ballot)]
+            votes += 1
+        return ciphers == self.ciphers and votes == self.votes
+
@@ -6,14 +6,16 @@ from django.test import TestCase
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
 
-from .models import Vote
+from .models import Vote, VoteAggregate
 from .serializers import VoteSerializer
+from authentication.models import RevokedVoterToken
 from base import mods
+from base.cache import voting_cache
 from base.models import Auth
 from base.tests import BaseTestCase
 from census.models import Census
 from mixnet.models import Key
-from voting.models import Question
+from voting.models import Question, QuestionOption
 from voting.models import Voting
 
 
@@ -77,6 +79,10 @@ class StoreTextCase(BaseTestCase):
         response = self.client.post('/store/', data, format='json')
         self.assertEqual(response.status_code, 401)
 
+        data['voting'] = 'abc'
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+
     def test_store_vote(self):
         VOTING_PK = 345
         CTE_A = 96
@@ -188,8 +194,102 @@ class StoreTextCase(BaseTestCase):
         response = self.client.post('/store/', data, format='json')
         self.assertEqual(response.status_code, 200)
 
+        # closed by another process, that doesn't invalidate the voting cache
+        # of this one until VOTING_CACHE_TTL
+        Voting.objects.filter(pk=5001).update(end_date=timezone.now() - datetime.timedelta(days=1))
+        voting_cache.clear()
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 401)
+
         # closed
         self.voting.end_date = timezone.now() - datetime.timedelta(days=1)
         self.voting.save()
         response = self.client.post('/store/', data, format='json')
         self.assertEqual(response.status_code, 401)
+
+    def test_store_vote_voter_token(self):
+        census = Census(voting_id=5001, voter_id=1)
+        census.save()
+        self.get_or_create_user(1)
+        data = {'username': 'user1', 'password': 'qwerty', 'voting': 5001}
+        response = self.client.post('/authentication/login/', data, format='json')
+        voter_token = response.json()['voter_token']
+
+        data = {
+            "voting": 5001,
+            "voter": 1,
+            "vote": { "a": 30, "b": 55 },
+            "voter_token": voter_token,
+        }
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Vote.objects.get(voting_id=5001, voter_id=1).b, 55)
+
+        data['voter'] = 2
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 401)
+
+        data['voter'] = 1
+        data['voter_token'] = voter_token[:-1]
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 401)
+
+        # only the valid voter tokens are revoked
+        for token in (voter_token[:-1], 'x' * 300, ['x']):
+            response = self.client.post('/authentication/logout/', {'voter_token': token},
+                                        format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(RevokedVoterToken.objects.exists())
+
+        response = self.client.post('/authentication/logout/', {'voter_token': voter_token},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        data['voter_token'] = voter_token
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_aggregate(self):
+        for i in range(2):
+            QuestionOption(question=self.question, option='option {}'.format(i + 1)).save()
+        self.voting.homomorphic = True
+        self.voting.pub_key = Key.objects.create(p=23, g=4, y=9)
+        self.voting.save()
+        for voter in (3001, 3002):
+            Census(voting_id=5001, voter_id=voter).save()
+            self.get_or_create_user(voter)
+
+        def vote(voter, ballot, status=200):
+            self.login(user='user{}'.format(voter))
+            data = {
+                "voting": 5001,
+                "voter": voter,
+                "vote": {"a": [c[0] for c in ballot], "b": [c[1] for c in ballot]},
+            }
+            response = self.client.post('/store/', data, format='json')
+            self.assertEqual(response.status_code, status)
+            return VoteAggregate.objects.get(voting_id=5001)
+
+        self.assertEqual(vote(3001, [[2, 3], [4, 6]]).ciphers, [[2, 3], [4, 6]])
+        aggregate = vote(3002, [[8, 9], [12, 13]])
+        self.assertEqual((aggregate.ciphers, aggregate.votes), ([[16, 4], [2, 9]], 2))
+
+        # the ciphertexts out of the group of the key are rejected, a 0
+        # would make the aggregate 0 for ever
+        for ballot in ([[0, 3], [4, 6]], [[2, 3], [5, 6]], [[2, 23], [4, 6]]):
+            aggregate = vote(3002, ballot, status=400)
+            self.assertEqual(aggregate.ciphers, [[16, 4], [2, 9]])
+
+        # the replaced vote is removed from the aggregate
+        aggregate = vote(3001, [[3, 3], [3, 3]])
+        self.assertEqual((aggregate.ciphers, aggregate.votes), ([[1, 4], [13, 16]], 2))
+
+        response = self.client.get('/store/aggregate/5001/?verify=1', format='json')
+        self.assertEqual(response.status_code, 403)
+        self.login()
+        response = self.client.get('/store/aggregate/5001/?verify=1', format='json')
+        self.assertEqual(response.json(), {'ciphers': [[1, 4], [13, 16]], 'votes': 2, 'valid': True})
+
+        Vote.objects.filter(voter_id=3002).delete()
+        response = self.client.get('/store/aggregate/5001/?verify=1', format='json')
+        self.assertFalse(response.json()['valid'])
+
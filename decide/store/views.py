@@ -1,14 +1,21 @@
+from django.conf import settings
+from django.db import transaction
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 import django_filters.rest_framework
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework import generics
+from rest_framework.views import APIView
 
-from .models import Vote
+from .models import Vote, VoteAggregate
 from .serializers import VoteSerializer
 from base import mods
 from base.perms import UserIsStaff
+from authentication.tokens import voter_token
+from census.models import Census
+from mixnet.mixcrypt import group_order, in_group
 
 
 class StoreView(generics.ListAPIView):
@@ -26,17 +33,26 @@ class StoreView(generics.ListAPIView):
         """
          * voting: id
          * voter: id
-         * vote: { "a": int, "b": int }
+         * vote: { "a": int, "b": int }, or { "a": [ int ], "b": [ int ] } in
+           homomorphic votings, with a ciphertext for each option
+         * voter_token: str / nullable, signed token for this voter and voting
         """
 
         vid = request.data.get('voting')
+        try:
+            vid = int(vid) if vid is not None else None
+        except (TypeError, ValueError):
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        # the dates are read from the cached voting, that is invalidated when
+        # the voting changes in this process, and after VOTING_CACHE_TTL in
+        # the rest
         voting = mods.get('voting', params={'id': vid})
         if not voting or not isinstance(voting, list):
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
-        start_date = voting[0].get('start_date', None)
-        end_date = voting[0].get('end_date', None)
-        not_started = not start_date or timezone.now() < parse_datetime(start_date)
-        is_closed = end_date and parse_datetime(end_date) < timezone.now()
+        start_date, end_date = [parse_datetime(voting[0][d]) if voting[0].get(d) else None
+                                for d in ('start_date', 'end_date')]
+        not_started = not start_date or timezone.now() < start_date
+        is_closed = end_date and end_date < timezone.now()
         if not_started or is_closed:
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -46,27 +62,82 @@ class StoreView(generics.ListAPIView):
         if not vid or not uid or not vote:
             return Response({}, status=status.HTTP_400_BAD_REQUEST)
 
-        # validating voter
-        token = request.auth.key
-        voter = mods.post('authentication', entry_point='/getuser/', json={'token': token})
-        voter_id = voter.get('id', None)
+        # validating voter, with the signed voter token if there's one or with the auth token
+        if request.data.get('voter_token'):
+            voter_id = voter_token.check_token(request.data['voter_token'], vid)
+        elif request.auth:
+            voter = mods.get_user(request.auth.key) or {}
+            voter_id = voter.get('id', None)
+        else:
+            voter_id = None
         if not voter_id or voter_id != uid:
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
 
         # the user is in the census
-        perms = mods.get('census/{}'.format(vid), params={'voter_id': uid}, response=True)
-        if perms.status_code == 401:
+        if 'census' in settings.MODULES:
+            in_census = Census.objects.is_voter(vid, uid)
+        else:
+            perms = mods.get('census/{}'.format(vid), params={'voter_id': uid}, response=True)
+            in_census = perms.status_code != 401
+        if not in_census:
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
 
         a = vote.get("a")
         b = vote.get("b")
+        ballot = None
+
+        if voting[0].get('homomorphic'):
+            noptions = len(voting[0]['question']['options'])
+            if not isinstance(a, list) or not isinstance(b, list) or \
+               not len(a) == len(b) == noptions or not voting[0].get('pub_key'):
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                ballot = [[int(x), int(y)] for x, y in zip(a, b)]
+            except (TypeError, ValueError):
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+            # every ciphertext is multiplied into the aggregate, one out of
+            # the group, like a 0, would break it for every vote
+            pk = voting[0]['pub_key']
+            p = int(pk['p'])
+            q = int(pk.get('q') or group_order(p))
+            if not all(in_group(x, p, q) for c in ballot for x in c):
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+            a, b = 0, 0
+
+        with transaction.atomic():
+            # the aggregate of homomorphic votings is updated with the vote
+            if ballot is not None:
+                aggregate = VoteAggregate.lock(vid, len(ballot))
+                replaced = Vote.objects.filter(voting_id=vid, voter_id=uid) \
+                                       .values_list('ballot', flat=True).first()
+                aggregate.add(ballot, voting[0]['pub_key']['p'], replaced)
 
-        defs = { "a": a, "b": b }
-        v, _ = Vote.objects.get_or_create(voting_id=vid, voter_id=uid,
-                                          defaults=defs)
-        v.a = a
-        v.b = b
+            defs = { "a": a, "b": b, "ballot": ballot }
+            v, _ = Vote.objects.get_or_create(voting_id=vid, voter_id=uid,
+                                              defaults=defs)
+            v.a = a
+            v.b = b
+            v.ballot = ballot
 
-        v.save()
+            v.save()
 
         return  Response({})
+
+
+class AggregateView(APIView):
+    permission_classes = (UserIsStaff,)
+
+    def get(self, request, voting_id):
+        """
+         * verify: bool / nullable, check the aggregate against the votes
+
+        Returns the aggregate of the ballots of a homomorphic voting,
+        { "ciphers": [ [int, int] ], "votes": int, "valid": bool }
+        """
+
+        aggregate = get_object_or_404(VoteAggregate, voting_id=voting_id)
+        data = {'ciphers': aggregate.ciphers, 'votes': aggregate.votes}
+        if request.GET.get('verify'):
+            voting = mods.get('voting', params={'id': voting_id})
+            data['valid'] = aggregate.verify(voting[0]['pub_key']['p'])
+        return Response(data)
@@ -1,19 +1,26 @@
-from django.contrib import admin
+import threading
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.db.models import Count
 from django.utils import timezone
 
 from .models import QuestionOption
 from .models import Question
 from .models import Voting
+from .models import TallyJob
 
+from .batch import run_tallies, schedule_tallies, start_votings
 from .filters import StartedFilter
+from .views import export_response
 
 
 def start(modeladmin, request, queryset):
-    for v in queryset.all():
-        v.create_pubkey()
-        v.start_date = timezone.now()
-        v.enviarTelegram("La votación "+str(v.name)+" ha comenzado")
-        v.save()
+    for v, elapsed, error in start_votings(queryset.all()):
+        if error:
+            modeladmin.message_user(request, "{}: {}".format(v.name, error), messages.ERROR)
+        else:
+            modeladmin.message_user(request, "{} started in {:.2f}s".format(v.name, elapsed))
 
 
 def stop(ModelAdmin, request, queryset):
@@ -23,15 +30,20 @@ def stop(ModelAdmin, request, queryset):
         v.save()
 
 
-def tally(ModelAdmin, request, queryset):
-    for v in queryset.filter(end_date__lt=timezone.now()):
-        token = request.session.get('auth-token', '')
-        v.tally_votes(token)
+def tally(modeladmin, request, queryset):
+    jobs = schedule_tallies(queryset.filter(end_date__lt=timezone.now()), request.user)
+    if jobs and settings.TALLY_IN_BACKGROUND:
+        threading.Thread(target=run_tallies, daemon=True).start()
+    modeladmin.message_user(request, "{} tallies scheduled".format(len(jobs)))
 
 def save(ModelAdmin, request ,queryset):
     for v in queryset.filter(end_date__lt=timezone.now()):
         v.saveFile()
 
+def export(ModelAdmin, request, queryset):
+    votings = queryset.filter(end_date__lt=timezone.now()).select_related('question')
+    return export_response(votings.order_by('id').iterator())
+
 class QuestionOptionInline(admin.TabularInline):
     model = QuestionOption
     fields= ('pref_number', 'option', 'number')
@@ -52,8 +64,27 @@ class VotingAdmin(admin.ModelAdmin):
     list_filter = (StartedFilter,)
     search_fields = ('name', )
 
-    actions = [ start, stop, tally, save ]
+    actions = [ start, stop, tally, save, export ]
+
+
+class TallyJobAdmin(admin.ModelAdmin):
+    list_display = ('voting', 'status', 'votes', 'created', 'started', 'finished', 'duration')
+    list_filter = ('status', )
+    readonly_fields = ('voting', 'user', 'status', 'votes', 'created', 'started', 'finished', 'error')
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # progress of the scheduled tallies
+        counts = dict(TallyJob.objects.values_list('status')
+                                      .annotate(n=Count('id')).order_by())
+        progress = ', '.join('{} {}'.format(counts.get(st, 0), name.lower())
+                             for st, name in TallyJob.STATUS)
+        extra_context = dict(extra_context or {}, title='Tallies: ' + progress)
+        return super().changelist_view(request, extra_context=extra_context)
 
 
 admin.site.register(Voting, VotingAdmin)
+admin.site.register(TallyJob, TallyJobAdmin)
 admin.site.register(Question, QuestionAdmin)
@@ -0,0 +1,280 @@
+import time
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from base import mods
+from base.models import Auth, Key
+
+
+def start_votings(votings, workers=None):
+    '''
+    Starts the votings, asking the mixnet for all the public keys at the
+    same time with a pool of threads, and saves the keys and the start dates
+    in a single transaction. The already started votings are skipped.
+
+    Returns a list with the voting, the seconds that the key took and the
+    error if the voting couldn't be started.
+    '''
+
+    workers = workers or settings.VOTING_START_WORKERS
+    votings = [v for v in votings if not v.start_date]
+    requests = {v.id: v.pubkey_request() for v in votings
+                if not v.pub_key and v.auths.exists()}
+
+    def create_key(voting):
+        start = time.perf_counter()
+        key, error = None, None
+        if voting.id in requests:
+            url, data = requests[voting.id]
+            try:
+                key = mods.post('mixnet', baseurl=url, json=data)
+                key = {k: key[k] for k in ('p', 'g', 'y', 'q', 'curve') if key.get(k)}
+                if voting.homomorphic and key.get('curve'):
+                    raise ValueError('homomorphic votings can not use elliptic curve keys')
+            except Exception as e:
+                key, error = None, 'Key not created: {!r}'.format(e)
+        return key, error, time.perf_counter() - start
+
+    # the threads only do the requests to the mixnet, the database is only
+    # used from this thread
+    if workers == 1 or len(requests) < 2:
+        results = [create_key(v) for v in votings]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(create_key, votings))
+
+    report = []
+    now = timezone.now()
+    with transaction.atomic():
+        for v, (key, error, elapsed) in zip(votings, results):
+            if not error:
+                if key:
+                    v.pub_key = Key.objects.create(**key)
+                v.start_date = now
+                v.save()
+            report.append((v, elapsed, error))
+
+    for v, elapsed, error in report:
+        if not error:
+            v.create_census_snapshot()
+            v.create_booth_payload()
+            v.enviarTelegram("La votación "+str(v.name)+" ha comenzado")
+
+    return report
+
+
+def count_votes(voting_id, token=''):
+    if 'store' in settings.MODULES:
+        from store.models import Vote
+        return Vote.objects.filter(voting_id=voting_id).count()
+    return len(mods.get('store', params={'voting_id': voting_id},
+                        HTTP_AUTHORIZATION='Token ' + token))
+
+
+def user_token(user):
+    if user is None:
+        return ''
+    from rest_framework.authtoken.models import Token
+    return Token.objects.get_or_create(user=user)[0].key
+
+
+def recover_tallies():
+    '''
+    Marks as failed the tallies running for more than TALLY_TIMEOUT seconds,
+    left behind by a worker that died, so they can be scheduled again.
+
+    Returns the number of recovered tallies.
+    '''
+
+    from .models import TallyJob
+
+    now = timezone.now()
+    started = now - timedelta(seconds=settings.TALLY_TIMEOUT)
+    return TallyJob.objects.filter(status='running', started__lt=started) \
+                           .update(status='failed', finished=now, error='Timed out')
+
+
+def schedule_tallies(votings, user=None):
+    '''
+    Creates a pending TallyJob for each voting not tallied nor already
+    scheduled, with its number of votes to run the largest first. The
+    tallies are run with the auth token of the user.
+    '''
+
+    from .models import TallyJob
+
+    recover_tallies()
+    token = user_token(user)
+    scheduled = TallyJob.objects.filter(status__in=('pending', 'running')) \
+                                .values_list('voting_id', flat=True)
+    return TallyJob.objects.bulk_create([
+        TallyJob(voting=v, votes=count_votes(v.id, token), user=user)
+        for v in votings.filter(tally__isnull=True).exclude(id__in=scheduled)
+    ])
+
+
+def run_job(job_id):
+    from .models import TallyJob
+
+    job = TallyJob.objects.select_related('voting', 'user').get(pk=job_id)
+    try:
+        job.voting.tally_votes(user_token(job.user))
+        job.status = 'done'
+    except Exception as e:
+        job.status = 'failed'
+        job.error = repr(e)
+    job.finished = timezone.now()
+    job.save()
+    return job.status
+
+
+def close_connections():
+    # each process opens its own database connections
+    connections.close_all()
+
+
+def run_tallies(workers=None):
+    '''
+    Runs the pending tallies, the largest votings first so the long tallies
+    don't end up alone at the end, at most TALLY_WORKERS at the same time,
+    each one in its own process. The jobs are claimed with skip_locked so
+    several schedulers can run at the same time.
+
+    Returns the number of tallies run.
+    '''
+
+    from .models import TallyJob
+
+    workers = workers or settings.TALLY_WORKERS
+    recover_tallies()
+    with transaction.atomic():
+        pending = TallyJob.objects.select_for_update(skip_locked=True) \
+                                  .filter(status='pending').order_by('-votes', 'id')
+        ids = list(pending.values_list('id', flat=True))
+        TallyJob.objects.filter(id__in=ids).update(status='running', started=timezone.now())
+
+    if workers == 1 or len(ids) < 2:
+        for job_id in ids:
+            run_job(job_id)
+    else:
+        close_connections()
+        with ProcessPoolExecutor(max_workers=workers, initializer=close_connections) as pool:
+            list(pool.map(run_job, ids))
+    return len(ids)
+
+
+def validation_messages(error):
+    if hasattr(error, 'error_dict'):
+        return ['{}: {}'.format(field, ' '.join(messages)) if field != NON_FIELD_ERRORS
+                else ' '.join(messages) for field, messages in error.message_dict.items()]
+    return error.messages
+
+
+def build_voting(definition):
+    '''
+    Returns the unsaved question, options and voting of a definition, with
+    the field validation of the models and the validation of the admin.
+    Raises ValidationError if the definition is not valid.
+    '''
+
+    from .models import Question, QuestionOption, Voting
+
+    d = definition
+    if not isinstance(d, dict):
+        raise ValidationError('Invalid voting definition')
+
+    yes_no = bool(d.get('yes_no_question'))
+    opts = d.get('question_opt')
+    if yes_no:
+        opts = [('YES', 1), ('NO', 2)]
+    elif not isinstance(opts, list) or not opts or \
+            not all(isinstance(o, (str, int)) and str(o) for o in opts):
+        raise ValidationError({'question_opt': ['A non empty list of options is needed']})
+    else:
+        opts = [(str(o), i + 2) for i, o in enumerate(opts)]
+
+    question = Question(desc=d.get('question'), yes_no_question=yes_no,
+                        question_options=d.get('question_options', 1))
+    voting = Voting(name=d.get('name'), desc=d.get('desc'), question=question,
+                    link=d.get('link') or None, homomorphic=bool(d.get('homomorphic')),
+                    ranked=bool(d.get('ranked')))
+
+    errors = {}
+    try:
+        question.clean_fields()
+    except ValidationError as e:
+        # the description of the question is the question field
+        errors.update({'question' if f == 'desc' else f: m for f, m in e.message_dict.items()})
+    # the unique link is checked by the database, without a query for each voting
+    try:
+        voting.clean_fields(exclude=['question', 'pub_key'])
+    except ValidationError as e:
+        errors.update(e.message_dict)
+    if not errors:
+        try:
+            voting.clean()
+        except ValidationError as e:
+            errors[NON_FIELD_ERRORS] = e.messages
+    if errors:
+        raise ValidationError(errors)
+
+    options = [QuestionOption(question=question, option=o, number=n) for o, n in opts]
+    return question, options, voting
+
+
+def create_votings(definitions):
+    '''
+    Creates the votings of the definitions with a bulk insert for each
+    model, questions, options, votings and auths, in a single transaction.
+    Each definition is a dict with the same fields as the VotingView post:
+
+     * name, desc, question
+     * question_opt: [ str ], not needed in yes/no questions
+     * yes_no_question, question_options, link, homomorphic, ranked: optional
+
+    The options are numbered as QuestionOption.save does, but without a
+    query for each option. Raises ValidationError with the errors of each
+    invalid definition by its position and name before anything is created.
+    Returns the created votings.
+    '''
+
+    from .models import Question, QuestionOption, Voting
+
+    built, errors = [], {}
+    for i, d in enumerate(definitions):
+        try:
+            built.append(build_voting(d))
+        except ValidationError as e:
+            name = d.get('name') if isinstance(d, dict) else None
+            key = 'voting {} ({})'.format(i, name) if name else 'voting {}'.format(i)
+            errors[key] = validation_messages(e)
+    if errors:
+        raise ValidationError(errors)
+
+    with transaction.atomic():
+        questions = Question.objects.bulk_create([q for q, opts, v in built])
+
+        # the objects are linked before the bulk inserts set their ids
+        options = []
+        for q, opts, v in built:
+            for o in opts:
+                o.question = q
+            options += opts
+        QuestionOption.objects.bulk_create(options)
+
+        for q, opts, v in built:
+            v.question = q
+        votings = Voting.objects.bulk_create([v for q, opts, v in built])
+
+        auth, _ = Auth.objects.get_or_create(url=settings.BASEURL,
+                                             defaults={'me': True, 'name': 'test auth'})
+        Voting.auths.through.objects.bulk_create([
+            Voting.auths.through(voting_id=v.id, auth_id=auth.id) for v in votings
+        ])
+
+    return votings
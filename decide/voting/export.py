@@ -0,0 +1,81 @@
+'''
+Archive of closed votings, streamed as gzip compressed json lines, one line
+for each voting followed by one line for each of its votes:
+
+    {"type": "voting", "id": 1, "name": ..., "census": 100, "tally": ..., ...}
+    {"type": "vote", "voting": 1, "a": ..., "b": ...}
+
+The votes of homomorphic votings have a ciphertext for each option in
+"ballot", with a and b set to 0.
+
+The votes are read with a database cursor, so any number of votings and
+votes are exported without loading them in memory.
+'''
+
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from base import mods
+
+
+def voting_votes(voting_id):
+    if 'store' in settings.MODULES:
+        from store.models import Vote
+        return (Vote.objects.filter(voting_id=voting_id)
+                            .order_by('id')
+                            .values_list('a', 'b', 'ballot')
+                            .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE))
+    return ((v['a'], v['b'], v.get('ballot'))
+            for v in mods.get('store', params={'voting_id': voting_id}))
+
+
+def census_size(voting_id):
+    if 'census' in settings.MODULES:
+        from census.models import Census
+        return Census.objects.filter(voting_id=voting_id).count()
+    return None
+
+
+def export_lines(votings):
+    encoder = DjangoJSONEncoder()
+    for v in votings:
+        yield encoder.encode({
+            'type': 'voting',
+            'id': v.id,
+            'name': v.name,
+            'desc': v.desc,
+            'question': v.question.desc,
+            'options': [{'number': o.number, 'option': o.option}
+                        for o in v.question.options.all()],
+            'start_date': v.start_date,
+            'end_date': v.end_date,
+            'census': census_size(v.id),
+            'tally': v.tally,
+            'postproc': v.postproc,
+        }) + '\n'
+
+        for a, b, ballot in voting_votes(v.id):
+            vote = {'type': 'vote', 'voting': v.id, 'a': a, 'b': b}
+            if ballot is not None:
+                vote['ballot'] = ballot
+            yield encoder.encode(vote) + '\n'
+
+
+def gzip_stream(lines, level=6):
+    '''
+    Compresses the lines as a gzip stream, yielding the compressed chunks
+    as they are produced.
+    '''
+
+    z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for line in lines:
+        data = z.compress(line.encode('utf-8'))
+        if data:
+            yield data
+    yield z.flush()
+
+
+def export_votings(votings):
+    return gzip_stream(export_lines(votings))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from voting.telegram import send_pending
+
+
+class Command(BaseCommand):
+    help = 'Send the queued telegram notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='keep sending until interrupted')
+        parser.add_argument('--interval', type=int, default=60,
+                            help='seconds between each run with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_pending()
+            print("Sent {} messages".format(sent))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
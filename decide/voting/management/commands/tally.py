@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from voting.batch import run_tallies
+
+
+class Command(BaseCommand):
+    help = 'Run the scheduled voting tallies, the largest first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='max number of tallies run at the same time')
+        parser.add_argument('--loop', action='store_true', help='keep running until interrupted')
+        parser.add_argument('--interval', type=int, default=10,
+                            help='seconds between each run with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            n = run_tallies(workers=options['workers'])
+            print("Run {} tallies".format(n))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -1,5 +1,4 @@
 import random
-import itertools
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
@@ -12,6 +11,7 @@ from census.models import Census
 from mixnet.mixcrypt import MixCrypt
 from mixnet.mixcrypt import ElGamal
 from voting.models import Voting, Question, QuestionOption
+from voting.tally import count_votes
 
 
 
@@ -82,13 +82,14 @@ class Command(BaseCommand):
         print("Tally")
         v.tally_votes()
 
-        tally = v.tally
-        tally.sort()
-        tally = {k: len(list(x)) for k, x in itertools.groupby(tally)}
+        options = v.question.options.all()
+        tally, invalid = count_votes(v.tally, [q.number for q in options])
 
         print("Result:")
-        for q in v.question.options.all():
-            print(" * {}: {} tally votes / {} emitted votes".format(q, tally.get(q.number, 0), clear.get(q.number, 0)))
+        for q in options:
+            print(" * {}: {} tally votes / {} emitted votes".format(q, tally[q.number], clear.get(q.number, 0)))
+        if invalid:
+            print(" * Invalid votes: {}".format(invalid))
 
         print("")
         print("Postproc Result:")
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-19 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0007_tallyjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='homomorphic',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-19 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0008_homomorphic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voting',
+            name='ranked',
+            field=models.BooleanField(default=False),
+        ),
+    ]
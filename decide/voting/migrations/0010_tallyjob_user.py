@@ -0,0 +1,25 @@
+# Generated by Django 2.0 on 2026-10-19 18:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('voting', '0009_voting_ranked'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='tallyjob',
+            name='token',
+        ),
+        migrations.AddField(
+            model_name='tallyjob',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
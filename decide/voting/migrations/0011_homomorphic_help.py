@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-19 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0010_tallyjob_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='voting',
+            name='homomorphic',
+            field=models.BooleanField(default=False, help_text='Tallied adding the encrypted votes. The ballots have no validity proofs, so a voter can add any number of votes to any option. Only allowed with the HOMOMORPHIC_VOTINGS setting.'),
+        ),
+    ]
@@ -1,15 +1,20 @@
 from django.db import models
+from django.contrib.auth.models import User
 from django.contrib.postgres.fields import JSONField
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 import os
-import requests
+import json
 from django.conf import settings
 from base import mods
+from base.cache import booth_cache, voting_cache
 from base.models import Auth, Key
-from dotenv import load_dotenv
+from census.models import CensusSnapshot
+from .tally import aggregate_ballots, count_homomorphic, count_rankings, count_votes
+from mixnet.mixcrypt import small_dlog
+from rest_framework.renderers import JSONRenderer
 
 from django.core.validators import RegexValidator
 
@@ -100,26 +105,80 @@ class Voting(models.Model):
     pub_key = models.OneToOneField(Key, related_name='voting', blank=True, null=True, on_delete=models.SET_NULL)
     auths = models.ManyToManyField(Auth, related_name='votings')
 
+    # single choice questions can be tallied adding the encrypted votes,
+    # without the mixnet shuffle, see tally_homomorphic
+    homomorphic = models.BooleanField(default=False, help_text=(
+        'Tallied adding the encrypted votes. The ballots have no validity proofs, '
+        'so a voter can add any number of votes to any option. Only allowed with '
+        'the HOMOMORPHIC_VOTINGS setting.'))
+    # the booth sends the votes of preference questions as rankings, encoded
+    # with tally.encode_ranking, instead of the selected option number
+    ranked = models.BooleanField(default=False)
+
     tally = JSONField(blank=True, null=True)
     postproc = JSONField(blank=True, null=True)
 
     file = models.FileField(blank=True)
 
-    def create_pubkey(self):
-        if self.pub_key or not self.auths.count():
-            return
+    def pubkey_request(self):
+        '''
+        Returns the url of the auth and the data to ask the mixnet for the
+        public key
+        '''
 
         auth = self.auths.first()
         data = {
             "voting": self.id,
             "auths": [ {"name": a.name, "url": a.url} for a in self.auths.all() ],
         }
-        key = mods.post('mixnet', baseurl=auth.url, json=data)
-        pk = Key(p=key["p"], g=key["g"], y=key["y"])
+        # only the g^m of the homomorphic votes can be encrypted in a Schnorr
+        # group, the option numbers need a safe prime
+        if not self.homomorphic:
+            data["qbits"] = 0
+        if settings.MIXNET_THRESHOLD and len(data["auths"]) > 1:
+            data["threshold"] = min(settings.MIXNET_THRESHOLD, len(data["auths"]))
+        return auth.url, data
+
+    def clean(self):
+        # the store accepts any ciphertext for each option of a homomorphic
+        # ballot, until they have validity proofs the homomorphic votings
+        # are only allowed when they are enabled in the settings
+        if self.homomorphic and not settings.HOMOMORPHIC_VOTINGS:
+            raise ValidationError('Homomorphic votings are not enabled')
+        # the aggregates are products of finite field ciphertexts
+        if self.homomorphic and (settings.MIXNET_CURVE or (self.pub_key and self.pub_key.curve)):
+            raise ValidationError('Homomorphic votings can not use elliptic curve keys')
+        if self.homomorphic and self.question.question_options == 2:
+            raise ValidationError('Preference questions can not be homomorphic')
+        if self.ranked and self.question.question_options != 2:
+            raise ValidationError('Only preference questions can be ranked')
+
+    def create_pubkey(self):
+        if self.pub_key or not self.auths.count():
+            return
+
+        url, data = self.pubkey_request()
+        key = mods.post('mixnet', baseurl=url, json=data)
+        if self.homomorphic and key.get("curve"):
+            raise ValueError('Homomorphic votings can not use elliptic curve keys')
+        pk = Key(p=key["p"], g=key["g"], y=key["y"], q=key.get("q"), curve=key.get("curve", ""))
         pk.save()
         self.pub_key = pk
         self.save()
 
+    def create_census_snapshot(self):
+        # the snapshot is only built if the census is served by this instance
+        if 'census' in settings.MODULES:
+            CensusSnapshot.build(self.id)
+
+    def create_booth_payload(self):
+        # the booth context is cached if the booth is served by this instance
+        if 'booth' in settings.MODULES:
+            from booth.payload import cache_payload
+            from .serializers import VotingSerializer
+            data = JSONRenderer().render(VotingSerializer(self).data)
+            cache_payload(json.loads(data.decode('utf-8')))
+
     def get_votes(self, token=''):
         # gettings votes from store
         votes = mods.get('store', params={'voting_id': self.id}, HTTP_AUTHORIZATION='Token ' + token)
@@ -131,6 +190,9 @@ class Voting(models.Model):
         The tally is a shuffle and then a decrypt
         '''
 
+        if self.homomorphic:
+            return self.tally_homomorphic(token)
+
         votes = self.get_votes(token)
 
         auth = self.auths.first()
@@ -147,7 +209,7 @@ class Voting(models.Model):
             pass
 
         # then, we can decrypt that
-        data = {"msgs": response.json()}
+        data = {"msgs": response.json(), "parallel": settings.MIXNET_PARALLEL_DECRYPT}
         response = mods.post('mixnet', entry_point=decrypt_url, baseurl=auth.url, json=data,
                 response=True)
 
@@ -161,25 +223,84 @@ class Voting(models.Model):
         self.do_postproc()
         
 
+    def tally_homomorphic(self, token=''):
+        '''
+        Each vote has a ciphertext of g^1 or g^0 for each option, so the
+        product of the ciphertexts of an option decrypts to g^(votes of the
+        option). The mixnet only decrypts one aggregate per option, and the
+        votes are the discrete logs, that are small. The aggregates are
+        maintained by the store with each vote, see store.models.VoteAggregate.
+
+        The ballots aren't proven to be well formed, a ballot with other
+        exponents adds them to the result or makes it invalid.
+        '''
+
+        numbers = sorted(opt.number for opt in self.question.options.all())
+        p, g = self.pub_key.p, self.pub_key.g
+
+        # the store keeps the aggregate updated with each vote
+        response = mods.get('store', entry_point='/aggregate/{}/'.format(self.id),
+                            HTTP_AUTHORIZATION='Token ' + token, response=True)
+        if response.status_code == 200 and len(response.json()['ciphers']) == len(numbers):
+            aggregates = response.json()['ciphers']
+            nvotes = response.json()['votes']
+        else:
+            votes = mods.get('store', params={'voting_id': self.id}, HTTP_AUTHORIZATION='Token ' + token)
+            ballots = [v['ballot'] for v in votes if v.get('ballot') and len(v['ballot']) == len(numbers)]
+            aggregates = aggregate_ballots(ballots, len(numbers), p)
+            nvotes = len(ballots)
+
+        auth = self.auths.first()
+        decrypt_url = "/decrypt/{}/".format(self.id)
+        data = {"msgs": aggregates, "keep_order": True,
+                "parallel": settings.MIXNET_PARALLEL_DECRYPT}
+        response = mods.post('mixnet', entry_point=decrypt_url, baseurl=auth.url, json=data,
+                response=True)
+
+        if response.status_code != 200 or len(response.json()) != len(numbers):
+            raise ValueError('The aggregates were not decrypted: {}'.format(response.status_code))
+
+        counts = small_dlog(g, response.json(), p, nvotes)
+        self.tally = {str(n): c for n, c in zip(numbers, counts)}
+        self.save()
+
+        self.do_postproc()
+
     def do_postproc(self):
-        tally = self.tally
+        tally = self.tally if isinstance(self.tally, list) else []
         options = self.question.options.all()
+        numbers = [opt.number for opt in options]
+
+        # ranked votings are postprocessed with the rankings, and the votes
+        # of each option are its first preferences
+        ballots = []
+        if isinstance(self.tally, dict):
+            votes, invalid = count_homomorphic(self.tally, numbers)
+        elif self.ranked and numbers:
+            ballots, ninvalid = count_rankings(tally, numbers)
+            votes = {n: 0 for n in numbers}
+            for b in ballots:
+                votes[b['ranking'][0]] += b['votes']
+            invalid = {'ranking': ninvalid} if ninvalid else {}
+        else:
+            votes, invalid = count_votes(tally, numbers)
 
         opts = []
         for opt in options:
-            if isinstance(tally, list):
-                votes = tally.count(opt.number)
-            else:
-                votes = 0
             opts.append({
                 'option': opt.option,
                 'number': opt.number,
-                'votes': votes
+                'votes': votes[opt.number]
             })
         msn ="Votación: "+self.name+"\n\n"
         for opt in opts:
             msn = str(msn)+str(opt.get('option'))+": "+(str(opt.get('votes')))+" votos.\n"
-        data = { 'type': 'IDENTITY', 'options': opts }
+        if invalid:
+            msn = str(msn)+"Votos no válidos: "+str(sum(invalid.values()))+"\n"
+        if self.ranked:
+            data = { 'type': 'BORDA', 'options': opts, 'ballots': ballots }
+        else:
+            data = { 'type': 'IDENTITY', 'options': opts }
         postp = mods.post('postproc', json=data)
         
 
@@ -211,17 +332,104 @@ class Voting(models.Model):
         return self.name
     
     #Método para enviar datos de los resultados por telegram (Pablo Franco Sánchez, visualización)
+    #El mensaje se encola y lo envía el comando sendtelegram, ver voting.telegram
     def enviarTelegram(self,msn):
-    
-        load_dotenv()
-        id = "-1001460398324"
-        url = "https://api.telegram.org/bot" + str(os.getenv("TELEGRAM_API_KEY")) + "/sendMessage"
+        TelegramMessage.objects.create(chat_id=settings.TELEGRAM_CHAT_ID, text=str(msn))
+
+
+class TallyJob(models.Model):
+    '''
+    Tally of a voting scheduled to run in background, see voting.batch
+    '''
+
+    STATUS = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    voting = models.ForeignKey(Voting, related_name='tally_jobs', on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS, default='pending')
+    votes = models.PositiveIntegerField(default=0)
+    # user that scheduled the tally, whose auth token is used to get the votes
+    # from the store when it runs
+    user = models.ForeignKey(User, blank=True, null=True, on_delete=models.SET_NULL)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+
+    def duration(self):
+        if self.started and self.finished:
+            return self.finished - self.started
+        return None
+
+    def __str__(self):
+        return '{}: {}'.format(self.voting, self.status)
+
+
+class TelegramMessage(models.Model):
+    chat_id = models.CharField(max_length=50)
+    text = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+    next_try = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    sent = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return self.text
+
+
+#The serialized votings cached by VotingView and the booth contexts are
+#removed when the voting, its question, options, key or auths change
+def invalidate_voting_cache(voting_ids):
+    voting_ids = set(voting_ids)
+    for vid in voting_ids:
+        for version in settings.ALLOWED_VERSIONS:
+            voting_cache.delete((vid, version))
+    booth_cache.delete_where(lambda payload: payload[0] in voting_ids)
+
+
+@receiver(post_save, sender=Voting)
+@receiver(post_delete, sender=Voting)
+def invalidate_voting(sender, instance, **kwargs):
+    invalidate_voting_cache([instance.id])
+
+
+@receiver(post_save, sender=Question)
+def invalidate_question(sender, instance, **kwargs):
+    invalidate_voting_cache(Voting.objects.filter(question_id=instance.id)
+                                          .values_list('id', flat=True))
+
+
+@receiver(post_save, sender=QuestionOption)
+@receiver(post_delete, sender=QuestionOption)
+def invalidate_option(sender, instance, **kwargs):
+    invalidate_voting_cache(Voting.objects.filter(question_id=instance.question_id)
+                                          .values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Key)
+def invalidate_key(sender, instance, **kwargs):
+    invalidate_voting_cache(Voting.objects.filter(pub_key_id=instance.id)
+                                          .values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=Voting.auths.through)
+def invalidate_auths(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_voting_cache([instance.id])
+    elif pk_set:
+        invalidate_voting_cache(pk_set)
+    else:
+        invalidate_voting_cache(instance.votings.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Auth)
+def invalidate_auth(sender, instance, **kwargs):
+    invalidate_voting_cache(instance.votings.values_list('id', flat=True))
 
-        params = {
-        'chat_id': id,
-        'text' : str(msn)
-        }
-        try:
-            requests.post(url, params=params)
-        except:
-            pass
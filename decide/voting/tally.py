@@ -0,0 +1,113 @@
+'''
+>>> count_votes([1, 2, 2, 7, 1, 2], [1, 2, 3])
+({1: 2, 2: 3, 3: 0}, {7: 1})
+>>> count_votes([], [1, 2])
+({1: 0, 2: 0}, {})
+>>> encode_ranking([3, 1], [1, 2, 3])
+22
+>>> decode_ranking(22, [1, 2, 3])
+[3, 1]
+>>> v = encode_ranking([2, 1, 3], [1, 2, 3])
+>>> count_rankings([v, 22, v, 7], [1, 2, 3])
+([{'ranking': [2, 1, 3], 'votes': 2}, {'ranking': [3, 1], 'votes': 1}], 1)
+>>> aggregate_ballots([[[2, 3], [4, 5]], [[6, 7], [8, 9]]], 2, 23)
+[[12, 21], [9, 22]]
+>>> count_homomorphic({'1': 2, '2': None, '3': 0}, [1, 2, 3])
+({1: 2, 2: 0, 3: 0}, {'aggregate': 1})
+'''
+
+from collections import Counter
+
+from mixnet.mixcrypt import multiply_ciphers
+
+
+def count_votes(tally, numbers):
+    '''
+    Counts the votes of each option number in a single pass over the
+    decrypted tally.
+
+    Returns the votes of each number and the votes of the unknown numbers,
+    that aren't any option of the question.
+    '''
+
+    counts = Counter(tally)
+    votes = {n: counts.pop(n, 0) for n in numbers}
+    return votes, dict(counts)
+
+
+# Preference votes are a ranking of the options numbers encoded as a number,
+# each digit in base max(numbers) + 2 is an option number + 1, the most
+# preferred first.
+
+def encode_ranking(ranking, numbers):
+    base = max(numbers) + 2
+    vote = 0
+    for n in ranking:
+        vote = vote * base + n + 1
+    return vote
+
+
+def decode_ranking(vote, numbers):
+    '''
+    Returns the ranking of the vote, or None if it isn't a valid ranking
+    '''
+
+    base = max(numbers) + 2
+    ranking = []
+    while vote > 0:
+        vote, digit = divmod(vote, base)
+        ranking.append(digit - 1)
+    ranking.reverse()
+
+    valid = set(numbers)
+    if not ranking or len(set(ranking)) != len(ranking) or not valid.issuperset(ranking):
+        return None
+    return ranking
+
+
+def count_rankings(tally, numbers):
+    '''
+    Groups the equal rankings of the tally, so the postprocessing works with
+    the distinct rankings instead of every vote.
+
+    Returns the list of { ranking, votes } and the number of invalid votes.
+    '''
+
+    rankings = Counter()
+    invalid = 0
+    for vote, count in Counter(tally).items():
+        ranking = decode_ranking(vote, numbers)
+        if ranking is None:
+            invalid += count
+        else:
+            rankings[tuple(ranking)] += count
+
+    ballots = [{'ranking': list(r), 'votes': v} for r, v in rankings.most_common()]
+    return ballots, invalid
+
+
+# Homomorphic votes are a ciphertext [a, b] for each option, ordered by number,
+# of g^1 for the selected option and g^0 for the rest.
+
+def aggregate_ballots(ballots, noptions, p):
+    '''
+    Returns the product of the ciphertexts of each option, that decrypts to
+    g^(votes of the option)
+    '''
+
+    return [list(multiply_ciphers((b[i] for b in ballots), p)) for i in range(noptions)]
+
+
+def count_homomorphic(tally, numbers):
+    '''
+    The tally of a homomorphic voting is the votes of each option number,
+    { str(number): votes }, or None if the aggregate of the option wasn't
+    decrypted to a valid number of votes.
+
+    Returns the votes of each number and the number of invalid aggregates.
+    '''
+
+    votes = {n: tally.get(str(n)) or 0 for n in numbers}
+    invalid = sum(1 for n in numbers if tally.get(str(n)) is None)
+    return votes, ({'aggregate': invalid} if invalid else {})
+
@@ -0,0 +1,89 @@
+import os
+from collections import OrderedDict
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from dotenv import load_dotenv
+
+from .models import TelegramMessage
+
+
+def join_messages(messages, max_length):
+    '''
+    Groups the messages of a chat in batches whose joined text doesn't
+    exceed max_length, so several notifications are sent as one message.
+    Yields each batch with its text. A message longer than max_length,
+    that telegram would never accept, is truncated.
+    '''
+
+    batch, texts, length = [], [], 0
+    for m in messages:
+        text = m.text if len(m.text) <= max_length else m.text[:max_length - 1] + '\u2026'
+        size = len(text) + (2 if batch else 0)
+        if batch and length + size > max_length:
+            yield batch, '\n\n'.join(texts)
+            batch, texts, length = [], [], 0
+            size = len(text)
+        batch.append(m)
+        texts.append(text)
+        length += size
+    if batch:
+        yield batch, '\n\n'.join(texts)
+
+
+def send_pending(post=requests.post):
+    '''
+    Sends the queued telegram messages, at most settings.TELEGRAM_BATCH per
+    run. The failed messages are retried later with an exponential backoff
+    up to settings.TELEGRAM_MAX_ATTEMPTS, and if telegram answers 429 the
+    sending stops until the retry_after that it returns.
+
+    post is the function used to do the requests, with the requests.post
+    signature. Returns the number of messages sent.
+    '''
+
+    load_dotenv()
+    url = settings.TELEGRAM_URL.format(key=os.getenv('TELEGRAM_API_KEY'))
+    now = timezone.now()
+
+    pending = TelegramMessage.objects.filter(sent__isnull=True, next_try__lte=now,
+                                             attempts__lt=settings.TELEGRAM_MAX_ATTEMPTS)
+    chats = OrderedDict()
+    for m in pending.order_by('id')[:settings.TELEGRAM_BATCH]:
+        chats.setdefault(m.chat_id, []).append(m)
+
+    sent = 0
+    for chat_id, messages in chats.items():
+        for batch, text in join_messages(messages, settings.TELEGRAM_MAX_LENGTH):
+            ids = [m.id for m in batch]
+            params = {'chat_id': chat_id, 'text': text}
+            try:
+                response = post(url, params=params, timeout=settings.TELEGRAM_TIMEOUT)
+            except requests.RequestException as e:
+                response, error = None, str(e)
+            else:
+                error = response.text
+
+            if response is not None and response.status_code == 200:
+                TelegramMessage.objects.filter(id__in=ids).update(sent=timezone.now(), error='')
+                sent += len(batch)
+                continue
+
+            if response is not None and response.status_code == 429:
+                # rate limited, nothing else is sent until retry_after
+                try:
+                    retry_after = response.json()['parameters']['retry_after']
+                except (ValueError, KeyError, TypeError):
+                    retry_after = 60
+                pending.update(next_try=now + timedelta(seconds=retry_after))
+                return sent
+
+            for m in batch:
+                m.attempts += 1
+                m.next_try = now + timedelta(seconds=2 ** m.attempts)
+                m.error = error
+                m.save()
+
+    return sent
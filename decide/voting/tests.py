@@ -669,4 +669,608 @@ class VotacionPrefModelTestCase2(BaseTestCase):
         self.assertNotEquals(vp.question.options.all()[1].number,3)
         self.assertNotEquals(vp.question.options.all()[2].option,"ave")
         self.assertNotEquals(vp.question.options.all()[2].number,1)
-'''
\ No newline at end of file
+'''
+
+import gzip
+import json
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient, APITransactionTestCase
+from django.utils import timezone
+
+from base import mods
+from base.cache import booth_cache, voting_cache
+from base.models import Auth, Key
+from base.tests import BaseTestCase
+from census.models import Census
+from store.models import Vote
+from voting.models import Voting, Question, QuestionOption, TallyJob, TelegramMessage
+from voting.batch import run_tallies, schedule_tallies, start_votings
+from voting.tally import encode_ranking
+from voting.telegram import send_pending
+from mixnet.mixcrypt import ElGamal, MixCrypt
+from mixnet.models import Mixnet
+
+
+class VotingQueriesTestCase(BaseTestCase):
+
+    def tearDown(self):
+        super().tearDown()
+        voting_cache.clear()
+
+    def create_votings(self, n):
+        a, _ = Auth.objects.get_or_create(url=settings.BASEURL,
+                                          defaults={'me': True, 'name': 'test auth'})
+        for i in range(n):
+            q = Question(desc='question {}'.format(i))
+            q.save()
+            for j in range(3):
+                QuestionOption(question=q, option='option {}'.format(j + 1)).save()
+            k = Key(p=23, g=5, y=8)
+            k.save()
+            v = Voting(name='voting {}'.format(i), question=q, pub_key=k, link=None)
+            v.save()
+            v.auths.add(a)
+
+    def test_list_votings_queries(self):
+        self.create_votings(1)
+        with self.assertNumQueries(3):
+            response = self.client.get('/voting/', format='json')
+        self.assertEqual(len(response.json()), 1)
+
+        self.create_votings(10)
+        with self.assertNumQueries(3):
+            response = self.client.get('/voting/', format='json')
+        self.assertEqual(len(response.json()), 11)
+        self.assertEqual(len(response.json()[0]['question']['options']), 3)
+
+        voting = Voting.objects.first()
+        with self.assertNumQueries(3):
+            response = self.client.get('/voting/?id={}'.format(voting.id), format='json')
+        self.assertEqual(response.json()[0]['pub_key'], {'p': 23, 'g': 5, 'y': 8})
+
+    def test_voting_etag(self):
+        self.create_votings(1)
+        voting = Voting.objects.first()
+        url = '/voting/?id={}'.format(voting.id)
+
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # the v2 representation has its own etag
+        response = self.client.get(url + '&version=v2', format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('pub_key', response.json()[0])
+
+        option = voting.question.options.first()
+        option.option = 'changed'
+        option.save()
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['question']['options'][0]['option'], 'changed')
+
+        etag = response['ETag']
+        voting.auths.clear()
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['auths'], [])
+
+
+class TelegramTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.requests = []
+        self.responses = []
+
+    def post(self, url, params, timeout):
+        # local stand-in of the telegram api
+        self.requests.append(params)
+        status, body = self.responses.pop(0) if self.responses else (200, '{"ok": true}')
+        response = requests.Response()
+        response.status_code = status
+        response._content = body.encode('utf-8')
+        return response
+
+    def create_voting(self):
+        q = Question(desc='test question')
+        q.save()
+        v = Voting(name='test voting', question=q)
+        v.save()
+        return v
+
+    def test_send_batch(self):
+        v = self.create_voting()
+        v.enviarTelegram('started')
+        v.enviarTelegram('stopped')
+        self.assertEqual(self.requests, [])
+
+        self.assertEqual(send_pending(post=self.post), 2)
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.requests[0]['text'], 'started\n\nstopped')
+        self.assertEqual(TelegramMessage.objects.filter(sent__isnull=True).count(), 0)
+
+        self.assertEqual(send_pending(post=self.post), 0)
+        self.assertEqual(len(self.requests), 1)
+
+    @override_settings(TELEGRAM_MAX_LENGTH=10)
+    def test_send_long(self):
+        v = self.create_voting()
+        v.enviarTelegram('started')
+        v.enviarTelegram('x' * 20)
+        v.enviarTelegram('stopped')
+
+        # the messages over the limit are truncated, not retried forever
+        self.assertEqual(send_pending(post=self.post), 3)
+        self.assertEqual([r['text'] for r in self.requests],
+                         ['started', 'x' * 9 + '\u2026', 'stopped'])
+        self.assertTrue(all(len(r['text']) <= 10 for r in self.requests))
+
+    def test_send_retry(self):
+        v = self.create_voting()
+        v.enviarTelegram('started')
+
+        self.responses = [(500, 'error')]
+        self.assertEqual(send_pending(post=self.post), 0)
+        m = TelegramMessage.objects.get()
+        self.assertEqual((m.attempts, m.error), (1, 'error'))
+
+        # it's retried after the backoff
+        self.assertEqual(send_pending(post=self.post), 0)
+        self.assertEqual(len(self.requests), 1)
+        TelegramMessage.objects.update(next_try=m.created)
+        self.assertEqual(send_pending(post=self.post), 1)
+
+    def test_send_rate_limited(self):
+        v = self.create_voting()
+        v.enviarTelegram('started')
+
+        self.responses = [(429, '{"ok": false, "parameters": {"retry_after": 30}}')]
+        self.assertEqual(send_pending(post=self.post), 0)
+        m = TelegramMessage.objects.get()
+        self.assertEqual(m.attempts, 0)
+        self.assertGreater(m.next_try, m.created + timedelta(seconds=29))
+
+
+class VotingExportTestCase(BaseTestCase):
+
+    def create_voting(self, name, closed=True):
+        q = Question(desc='question')
+        q.save()
+        QuestionOption(question=q, option='option 1').save()
+        v = Voting(name=name, question=q, link=None, start_date=timezone.now(),
+                   end_date=timezone.now() if closed else None,
+                   tally=[2], postproc=[{'option': 'option 1', 'votes': 1}])
+        v.save()
+        for i in range(3):
+            Census(voting_id=v.id, voter_id=i + 1).save()
+            Vote(voting_id=v.id, voter_id=i + 1, a=10 + i, b=20 + i).save()
+        return v
+
+    def export(self, params=''):
+        response = self.client.get('/voting/export/' + params)
+        if response.status_code != 200:
+            return response.status_code, []
+        data = gzip.decompress(b''.join(response.streaming_content))
+        return 200, [json.loads(l) for l in data.decode('utf-8').splitlines()]
+
+    def test_export(self):
+        v1 = self.create_voting('voting 1')
+        v2 = self.create_voting('voting 2')
+        self.create_voting('voting 3', closed=False)
+        # not closed yet, with the end date scheduled
+        v4 = self.create_voting('voting 4', closed=False)
+        Voting.objects.filter(pk=v4.pk).update(end_date=timezone.now() + timedelta(days=1))
+
+        self.assertEqual(self.export()[0], 401)
+        self.login()
+
+        status, lines = self.export()
+        self.assertEqual(status, 200)
+        self.assertEqual(len(lines), 8)
+        self.assertEqual([l['id'] for l in lines if l['type'] == 'voting'], [v1.id, v2.id])
+        self.assertEqual(lines[0]['census'], 3)
+        self.assertEqual(lines[0]['postproc'], [{'option': 'option 1', 'votes': 1}])
+        self.assertEqual(lines[1], {'type': 'vote', 'voting': v1.id, 'a': 10, 'b': 20})
+
+        status, lines = self.export('?ids={}'.format(v2.id))
+        self.assertEqual([l['name'] for l in lines if l['type'] == 'voting'], ['voting 2'])
+
+        self.assertEqual(self.export('?ids=a')[0], 400)
+        self.assertEqual(self.export('?ids=0')[0], 404)
+
+
+class VotingBatchTestCase(BaseTestCase):
+
+    def create_voting(self, name, auth=True):
+        q = Question(desc='question')
+        q.save()
+        QuestionOption(question=q, option='option 1').save()
+        v = Voting(name=name, question=q, link=None)
+        v.save()
+        if auth:
+            a, _ = Auth.objects.get_or_create(url=settings.BASEURL,
+                                              defaults={'me': True, 'name': 'test auth'})
+            v.auths.add(a)
+        return v
+
+    def test_start_votings(self):
+        v1 = self.create_voting('voting 1')
+        v2 = self.create_voting('voting 2', auth=False)
+        v3 = self.create_voting('voting 3')
+        v3.start_date = timezone.now()
+        v3.save()
+
+        report = start_votings(Voting.objects.order_by('id'), workers=1)
+        self.assertEqual([(v.id, error) for v, _, error in report], [(v1.id, None), (v2.id, None)])
+
+        v1.refresh_from_db()
+        v2.refresh_from_db()
+        self.assertTrue(v1.pub_key)
+        self.assertIsNone(v2.pub_key)
+        self.assertEqual(v1.start_date, v2.start_date)
+        self.assertEqual(TelegramMessage.objects.count(), 2)
+
+        self.assertEqual(start_votings(Voting.objects.all(), workers=1), [])
+
+    def test_schedule_tallies(self):
+        v1 = self.create_voting('voting 1', auth=False)
+        v2 = self.create_voting('voting 2', auth=False)
+        v3 = self.create_voting('voting 3', auth=False)
+        v3.tally = []
+        v3.save()
+        for i in range(3):
+            Vote(voting_id=v2.id, voter_id=i + 1, a=1, b=1).save()
+        Vote(voting_id=v1.id, voter_id=1, a=1, b=1).save()
+
+        jobs = schedule_tallies(Voting.objects.all())
+        self.assertEqual(sorted((j.voting_id, j.votes) for j in jobs), [(v1.id, 1), (v2.id, 3)])
+        self.assertEqual(schedule_tallies(Voting.objects.all()), [])
+
+        # without auths the tallies fail, largest first
+        self.assertEqual(run_tallies(workers=1), 2)
+        jobs = TallyJob.objects.order_by('finished')
+        self.assertEqual([j.voting_id for j in jobs], [v2.id, v1.id])
+        self.assertEqual({j.status for j in jobs}, {'failed'})
+        self.assertEqual(run_tallies(workers=1), 0)
+
+        self.client.force_login(User.objects.create_superuser('super', 'super@decide.es', 'qwerty'))
+        with override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+            response = self.client.get('/admin/voting/tallyjob/')
+        self.assertContains(response, 'Tallies: 0 pending, 0 running, 0 done, 2 failed')
+
+    def test_recover_tallies(self):
+        v1 = self.create_voting('voting 1', auth=False)
+        v2 = self.create_voting('voting 2', auth=False)
+        started = timezone.now() - timedelta(seconds=settings.TALLY_TIMEOUT + 1)
+        dead = TallyJob.objects.create(voting=v1, status='running', started=started)
+        alive = TallyJob.objects.create(voting=v2, status='running', started=timezone.now())
+
+        user = User.objects.get(username='admin')
+        jobs = schedule_tallies(Voting.objects.all(), user)
+        self.assertEqual([(j.voting_id, j.user) for j in jobs], [(v1.id, user)])
+        dead.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((dead.status, dead.error), ('failed', 'Timed out'))
+        self.assertEqual(alive.status, 'running')
+
+    # the auths requests are done in this thread, with the test db
+    @override_settings(MIXNET_CURVE='P-256', MIXNET_WORKERS=1)
+    def test_start_votings_curve(self):
+        v = self.create_voting('voting 1')
+        self.assertEqual(start_votings(Voting.objects.all(), workers=1)[0][2], None)
+        v.refresh_from_db()
+        self.assertEqual(v.pub_key.curve, 'P-256')
+
+        # the homomorphic votings can't use them
+        with override_settings(HOMOMORPHIC_VOTINGS=True):
+            with self.assertRaises(ValidationError):
+                v.homomorphic = True
+                v.clean()
+            self.login()
+            data = {'name': 'v', 'question': 'q', 'question_opt': ['a'], 'homomorphic': True}
+            response = self.client.post('/voting/bulk/', {'votings': [data]}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_create_votings(self):
+        data = {'votings': [
+            {'name': 'voting 1', 'question': 'q 1', 'question_opt': ['a', 'b', 'c']},
+            {'name': 'voting 2', 'question': 'q 2', 'yes_no_question': True, 'link': 'v2'},
+        ]}
+        response = self.client.post('/voting/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 401)
+
+        self.login()
+        response = self.client.post('/voting/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        v1, v2 = [Voting.objects.get(pk=pk) for pk in response.json()['votings']]
+        self.assertEqual([(o.option, o.number) for o in v1.question.options.order_by('id')],
+                         [('a', 2), ('b', 3), ('c', 4)])
+        self.assertEqual([(o.option, o.number) for o in v2.question.options.order_by('id')],
+                         [('YES', 1), ('NO', 2)])
+        self.assertEqual((v1.link, v2.link), (None, 'v2'))
+        self.assertEqual(v1.auths.count(), 1)
+
+        # duplicated link
+        response = self.client.post('/voting/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 409)
+
+        jsonnet = '[{name: "voting " + i, question: "q", question_opt: ["a", "b"]} for i in ["3", "4"]]'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/voting/bulk/', {'jsonnet': jsonnet}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Voting.objects.filter(name__in=['voting 3', 'voting 4']).count(), 2)
+
+        # the number of queries doesn't depend on the number of votings
+        jsonnet = jsonnet.replace('["3", "4"]', '[std.toString(i) for i in std.range(5, 20)]')
+        with self.assertNumQueries(len(queries)):
+            response = self.client.post('/voting/bulk/', {'jsonnet': jsonnet}, format='json')
+        self.assertEqual(len(response.json()['votings']), 16)
+
+        response = self.client.post('/voting/bulk/', {'votings': [{'name': 'v'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # the errors of each invalid definition, and nothing is created
+        votings = [
+            {'name': 'ok', 'question': 'q', 'question_opt': ['a']},
+            {'name': 'x' * 201, 'question': 'q', 'question_opt': ['a']},
+            {'name': 'v', 'question': 'q', 'question_opt': 'ab'},
+            {'name': 'w', 'question': 'q', 'question_opt': ['a'], 'question_options': 'x'},
+            {'name': 'l', 'question': '', 'question_opt': [{}], 'link': 'a-b'},
+            'v',
+        ]
+        response = self.client.post('/voting/bulk/', {'votings': votings}, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(sorted(errors), ['voting 1 ({})'.format('x' * 201), 'voting 2 (v)',
+                                          'voting 3 (w)', 'voting 4 (l)', 'voting 5'])
+        self.assertIn('name', errors['voting 1 ({})'.format('x' * 201)][0])
+        self.assertIn('question_opt', errors['voting 2 (v)'][0])
+        self.assertIn('question_options', errors['voting 3 (w)'][0])
+        self.assertFalse(Voting.objects.filter(name='ok').exists())
+
+        response = self.client.post('/voting/bulk/', {'jsonnet': '[1 +]'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # the server files can't be imported
+        for imp in ('import', 'importstr'):
+            jsonnet = '[{name: %s "/etc/passwd"}]' % imp
+            response = self.client.post('/voting/bulk/', {'jsonnet': jsonnet}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertNotIn('root', response.json())
+
+
+class HomomorphicTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        q = Question(desc='question')
+        q.save()
+        for i in range(3):
+            QuestionOption(question=q, option='option {}'.format(i + 1)).save()
+        self.voting = Voting(name='voting', question=q, link=None, homomorphic=True)
+        self.voting.save()
+        a, _ = Auth.objects.get_or_create(url=settings.BASEURL,
+                                          defaults={'me': True, 'name': 'test auth'})
+        self.voting.auths.add(a)
+        self.voting.create_pubkey()
+
+    def encrypt_ballot(self, selected):
+        pk = self.voting.pub_key
+        k = MixCrypt(bits=settings.KEYBITS)
+        k.k = ElGamal.construct((pk.p, pk.g, pk.y))
+        numbers = sorted(o.number for o in self.voting.question.options.all())
+        return [list(k.encrypt(pk.g if n == selected else 1)) for n in numbers]
+
+    def test_tally_homomorphic(self):
+        numbers = sorted(o.number for o in self.voting.question.options.all())
+        selected = [numbers[0]] * 3 + [numbers[2]] * 2
+        for voter, n in enumerate(selected):
+            Vote(voting_id=self.voting.id, voter_id=voter + 1, a=0, b=0,
+                 ballot=self.encrypt_ballot(n)).save()
+
+        self.voting.end_date = timezone.now()
+        self.voting.save()
+        self.login()
+        self.voting.tally_votes(self.token)
+
+        self.voting.refresh_from_db()
+        self.assertEqual(self.voting.tally, {str(numbers[0]): 3, str(numbers[1]): 0,
+                                             str(numbers[2]): 2})
+        votes = {o['number']: o['votes'] for o in self.voting.postproc}
+        self.assertEqual(votes, {numbers[0]: 3, numbers[1]: 0, numbers[2]: 2})
+
+    def test_store_homomorphic(self):
+        self.voting.start_date = timezone.now()
+        self.voting.save()
+        user = User.objects.get(username='noadmin')
+        Census(voting_id=self.voting.id, voter_id=user.id).save()
+        self.login(user='noadmin')
+
+        ballot = self.encrypt_ballot(2)
+        data = {
+            'voting': self.voting.id,
+            'voter': user.id,
+            'vote': {'a': [c[0] for c in ballot], 'b': [c[1] for c in ballot]},
+        }
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Vote.objects.get(voting_id=self.voting.id).ballot, ballot)
+
+        data['vote'] = {'a': 1, 'b': 2}
+        response = self.client.post('/store/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # tallied with the aggregate kept by the store
+        self.voting.end_date = timezone.now()
+        self.voting.save()
+        self.login()
+        self.voting.tally_votes(self.token)
+        self.voting.refresh_from_db()
+        self.assertEqual(self.voting.tally, {'2': 1, '3': 0, '4': 0})
+
+        # exported with the ballot
+        response = self.client.get('/voting/export/')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8').splitlines()
+        self.assertEqual(json.loads(lines[1])['ballot'], ballot)
+
+    def test_pubkey_request(self):
+        # only the homomorphic votings can get a Schnorr group key
+        self.assertNotIn('qbits', self.voting.pubkey_request()[1])
+        self.voting.homomorphic = False
+        self.assertEqual(self.voting.pubkey_request()[1]['qbits'], 0)
+
+    def test_tally_homomorphic_error(self):
+        Mixnet.objects.filter(voting_id=self.voting.id).delete()
+        self.voting.start_date = timezone.now()
+        self.voting.end_date = timezone.now()
+        self.voting.save()
+        self.login()
+        response = self.client.put('/voting/{}/'.format(self.voting.id), {'action': 'tally'},
+                                   format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), 'The aggregates were not decrypted: 404')
+        self.voting.refresh_from_db()
+        self.assertIsNone(self.voting.tally)
+
+    def test_homomorphic_setting(self):
+        self.login()
+        data = {'name': 'v', 'desc': 'd', 'question': 'q', 'question_opt': ['a', 'b'],
+                'homomorphic': True}
+        response = self.client.post('/voting/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/voting/bulk/', {'votings': [data]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        with override_settings(HOMOMORPHIC_VOTINGS=True):
+            response = self.client.post('/voting/', data, format='json')
+            self.assertEqual(response.status_code, 201)
+            response = self.client.post('/voting/bulk/', {'votings': [data]}, format='json')
+            self.assertEqual(response.status_code, 201)
+
+            # preference questions can't be homomorphic
+            data['question_options'] = 2
+            response = self.client.post('/voting/bulk/', {'votings': [data]}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Voting.objects.filter(homomorphic=True, name='v').count(), 2)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class RankedVotingTestCase(BaseTestCase):
+
+    def create_voting(self, ranked):
+        q = Question(desc='preference question', question_options=2)
+        q.save()
+        for i in range(3):
+            QuestionOption(question=q, option='option {}'.format(i + 1)).save()
+        v = Voting(name='preference voting', question=q, link=None, ranked=ranked)
+        v.save()
+        a, _ = Auth.objects.get_or_create(url=settings.BASEURL,
+                                          defaults={'me': True, 'name': 'test auth'})
+        v.auths.add(a)
+        v.create_pubkey()
+        v.create_booth_payload()
+        return v
+
+    def tearDown(self):
+        super().tearDown()
+        booth_cache.clear()
+
+    def booth_votes(self, v, choices):
+        # encrypted as the booth does with the voting of its payload
+        voting = json.loads(self.client.get('/booth/{}/'.format(v.id)).context['voting'])
+        pk = voting['pub_key']
+        k = MixCrypt(bits=settings.KEYBITS)
+        k.k = ElGamal.construct((int(pk['p']), int(pk['g']), int(pk['y'])))
+        numbers = [o['number'] for o in voting['question']['options']]
+        for voter, choice in enumerate(choices):
+            msg = encode_ranking(choice, numbers) if voting['ranked'] else choice
+            a, b = k.encrypt(msg)
+            Vote(voting_id=v.id, voter_id=3001 + voter, a=a, b=b).save()
+        return numbers
+
+    def tally(self, v):
+        v.end_date = timezone.now()
+        v.save()
+        self.login()
+        v.tally_votes(self.token)
+        v.refresh_from_db()
+        return {o['number']: o['votes'] for o in v.postproc}
+
+    def test_ranked_voting(self):
+        v = self.create_voting(ranked=True)
+        n1, n2, n3 = sorted(o.number for o in v.question.options.all())
+        self.booth_votes(v, [[n1, n2, n3], [n1, n3], [n3, n2, n1]])
+
+        self.assertEqual(self.tally(v), {n1: 2, n2: 0, n3: 1})
+        points = {o['number']: o['postproc'] for o in v.postproc}
+        self.assertEqual(points, {n1: 4, n2: 2, n3: 3})
+
+    def test_plain_preference_voting(self):
+        v = self.create_voting(ranked=False)
+        n1, n2, n3 = sorted(o.number for o in v.question.options.all())
+        self.booth_votes(v, [n1, n2, n2, n3, n3, n3])
+
+        self.assertEqual(self.tally(v), {n1: 1, n2: 2, n3: 3})
+
+    def test_ranked_needs_preference_question(self):
+        q = Question(desc='simple question')
+        q.save()
+        with self.assertRaises(ValidationError):
+            Voting(name='voting', question=q, ranked=True).clean()
+
+
+# the tallies run in other processes, that only see the committed data
+@override_settings(MIXNET_WORKERS=1)
+class TallyProcessesTestCase(APITransactionTestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        mods.mock_query(self.client)
+        self.user = User.objects.create_user('admin', is_staff=True)
+
+    def create_voting(self, name, selected):
+        q = Question(desc='question')
+        q.save()
+        for i in range(2):
+            QuestionOption(question=q, option='option {}'.format(i + 1)).save()
+        v = Voting(name=name, question=q, link=None, start_date=timezone.now())
+        v.save()
+        a, _ = Auth.objects.get_or_create(url=settings.BASEURL,
+                                          defaults={'me': True, 'name': 'test auth'})
+        v.auths.add(a)
+        v.create_pubkey()
+
+        k = MixCrypt(bits=settings.KEYBITS)
+        k.k = ElGamal.construct((v.pub_key.p, v.pub_key.g, v.pub_key.y))
+        for voter, n in enumerate(selected):
+            a, b = k.encrypt(n)
+            Vote(voting_id=v.id, voter_id=3001 + voter, a=a, b=b).save()
+        v.end_date = timezone.now()
+        v.save()
+        return v
+
+    def test_run_tallies_processes(self):
+        v1 = self.create_voting('voting 1', [2, 2, 3])
+        v2 = self.create_voting('voting 2', [3])
+        self.assertEqual(len(schedule_tallies(Voting.objects.all(), self.user)), 2)
+
+        self.assertEqual(run_tallies(workers=2), 2)
+        self.assertEqual(set(TallyJob.objects.values_list('status', flat=True)), {'done'})
+        v1.refresh_from_db()
+        v2.refresh_from_db()
+        self.assertEqual(sorted(v1.tally), [2, 2, 3])
+        self.assertEqual(v2.tally, [3])
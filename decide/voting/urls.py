@@ -5,4 +5,6 @@ from . import views
 urlpatterns = [
     path('', views.VotingView.as_view(), name='voting'),
     path('<int:voting_id>/', views.VotingUpdate.as_view(), name='voting'),
+    path('bulk/', views.VotingBulk.as_view(), name='voting-bulk'),
+    path('export/', views.VotingExport.as_view(), name='voting-export'),
 ]
@@ -1,18 +1,31 @@
+import hashlib
+import json
+
 import django_filters.rest_framework
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.utils import IntegrityError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from .batch import create_votings
+from .export import export_votings
 from .models import Question, QuestionOption, Voting
 from .serializers import SimpleVotingSerializer, VotingSerializer
+from base.cache import voting_cache
 from base.perms import UserIsStaff
 from base.models import Auth
 
 
 class VotingView(generics.ListCreateAPIView):
-    queryset = Voting.objects.all()
+    queryset = Voting.objects.select_related('question', 'pub_key') \
+                             .prefetch_related('question__options', 'auths')
     serializer_class = VotingSerializer
     filter_backends = (django_filters.rest_framework.DjangoFilterBackend,)
     filter_fields = ('id', )
@@ -24,8 +37,35 @@ class VotingView(generics.ListCreateAPIView):
         if version == 'v2':
             self.serializer_class = SimpleVotingSerializer
 
+        vid = request.GET.get('id', '')
+        if vid.isdigit() and set(request.GET) <= {'id', 'version'}:
+            return self.get_cached(request, int(vid), version)
+
         return super().get(request, *args, **kwargs)
 
+    def get_cached(self, request, voting_id, version):
+        '''
+        The serialized voting is cached until it changes, see
+        invalidate_voting_cache, with a strong ETag to answer with a 304 if
+        the client already has it.
+        '''
+
+        entry = voting_cache.get((voting_id, version))
+        if entry is None:
+            votings = self.filter_queryset(self.get_queryset())
+            body = JSONRenderer().render(self.get_serializer(votings, many=True).data)
+            entry = (body, '"{}"'.format(hashlib.sha1(body).hexdigest()))
+            voting_cache.set((voting_id, version), entry)
+
+        body, etag = entry
+        etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in etags or '*' in etags:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
     def post(self, request, *args, **kwargs):
         self.permission_classes = (UserIsStaff,)
         self.check_permissions(request)
@@ -33,13 +73,18 @@ class VotingView(generics.ListCreateAPIView):
             if not data in request.data:
                 return Response({}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            Voting(homomorphic=bool(request.data.get('homomorphic')), question=Question()).clean()
+        except ValidationError as e:
+            return Response(' '.join(e.messages), status=status.HTTP_400_BAD_REQUEST)
+
         question = Question(desc=request.data.get('question'))
         question.save()
         for idx, q_opt in enumerate(request.data.get('question_opt')):
             opt = QuestionOption(question=question, option=q_opt, number=idx)
             opt.save()
         voting = Voting(name=request.data.get('name'), desc=request.data.get('desc'),
-                question=question)
+                question=question, homomorphic=bool(request.data.get('homomorphic')))
         voting.save()
 
         auth, _ = Auth.objects.get_or_create(url=settings.BASEURL,
@@ -49,8 +94,47 @@ class VotingView(generics.ListCreateAPIView):
         return Response({}, status=status.HTTP_201_CREATED)
 
 
+def jsonnet_no_imports(base, path):
+    # the jsonnet of the requests can't read the files of the server
+    raise RuntimeError('imports are not allowed')
+
+
+class VotingBulk(APIView):
+    permission_classes = (UserIsStaff,)
+
+    def post(self, request):
+        """
+         * votings: [ voting ], with the fields of the VotingView post
+         * jsonnet: str, jsonnet source that evaluates to the votings list,
+           instead of votings
+
+        Creates all the votings at once, see batch.create_votings
+        """
+
+        votings = request.data.get('votings')
+        if 'jsonnet' in request.data:
+            from _jsonnet import evaluate_snippet
+            try:
+                votings = json.loads(evaluate_snippet('votings', request.data['jsonnet'],
+                                                      import_callback=jsonnet_no_imports))
+            except RuntimeError as e:
+                return Response('Invalid jsonnet: {}'.format(e), status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(votings, list) or not votings:
+            return Response('Invalid votings list', status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            votings = create_votings(votings)
+        except ValidationError as e:
+            return Response(e.message_dict, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            return Response('Duplicated voting link', status=status.HTTP_409_CONFLICT)
+
+        return Response({'votings': [v.id for v in votings]}, status=status.HTTP_201_CREATED)
+
+
 class VotingUpdate(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Voting.objects.all()
+    queryset = Voting.objects.select_related('question', 'pub_key') \
+                             .prefetch_related('question__options', 'auths')
     serializer_class = VotingSerializer
     filter_backends = (django_filters.rest_framework.DjangoFilterBackend,)
     permission_classes = (UserIsStaff,)
@@ -70,6 +154,8 @@ class VotingUpdate(generics.RetrieveUpdateDestroyAPIView):
             else:
                 voting.start_date = timezone.now()
                 voting.save()
+                voting.create_census_snapshot()
+                voting.create_booth_payload()
                 msg = 'Voting started'
         elif action == 'stop':
             if not voting.start_date:
@@ -93,8 +179,12 @@ class VotingUpdate(generics.RetrieveUpdateDestroyAPIView):
                 msg = 'Voting already tallied'
                 st = status.HTTP_400_BAD_REQUEST
             else:
-                voting.tally_votes(request.auth.key)
-                msg = 'Voting tallied'
+                try:
+                    voting.tally_votes(request.auth.key)
+                    msg = 'Voting tallied'
+                except ValueError as e:
+                    msg = str(e)
+                    st = status.HTTP_400_BAD_REQUEST
         elif action == 'save':
             if not voting.start_date:
                 msg = 'Voting is not started'
@@ -112,3 +202,33 @@ class VotingUpdate(generics.RetrieveUpdateDestroyAPIView):
             msg = 'Action not found, try with start, stop or tally'
             st = status.HTTP_400_BAD_REQUEST
         return Response(msg, status=st)
+
+
+def export_response(votings):
+    response = StreamingHttpResponse(export_votings(votings), content_type='application/gzip')
+    response['Content-Disposition'] = 'attachment; filename="votings.jsonl.gz"'
+    return response
+
+
+class VotingExport(APIView):
+    permission_classes = (UserIsStaff,)
+
+    def get(self, request):
+        """
+        Streams the archive of the closed votings, of the ids param (comma
+        separated) or all of them, see voting.export
+        """
+
+        votings = Voting.objects.filter(end_date__lt=timezone.now()) \
+                                .select_related('question').order_by('id')
+        ids = request.GET.get('ids')
+        if ids:
+            try:
+                votings = votings.filter(id__in=[int(i) for i in ids.split(',')])
+            except ValueError:
+                return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        if not votings.exists():
+            return Response({}, status=status.HTTP_404_NOT_FOUND)
+
+        return export_response(votings.iterator())
+
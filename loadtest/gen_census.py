@@ -20,16 +20,10 @@ def create_voters(filename):
     response = requests.post(HOST + '/authentication/login/', data=data)
     token = response.json()
 
-    voters_pk = []
-    invalid_voters = []
-    for username, pwd in voters.items():
-        token.update({'username': username, 'password': pwd})
-        response = requests.post(HOST + '/authentication/register/', data=token)
-        if response.status_code == 201:
-            voters_pk.append(response.json().get('user_pk'))
-        else:
-            invalid_voters.append(username)
-    return voters_pk, invalid_voters
+    token.update({'voters': voters})
+    response = requests.post(HOST + '/authentication/register/bulk/', json=token)
+    created = response.json()
+    return list(created['users'].values()), created['invalid']
 
 
 def add_census(voters_pk, voting_pk):